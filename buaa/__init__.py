@@ -3,32 +3,70 @@ import re
 import json
 import time
 import datetime
-import smtp
-
-from . import bykc_encrypt
+import threading
+import functools
+import hashlib
+import bisect
+import array
+import collections.abc
+import importlib.util
+import sys
+import os
+
+
+def _lazy_module(name):
+    # Imports a module whose code only runs on first attribute access.
+    module = sys.modules.get(name, None)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# Mail support and the BYKC cipher are only needed by some commands.
+smtp = _lazy_module('smtp')
+bykc_encrypt = _lazy_module(f'{__name__}.bykc_encrypt')
+urllib3 = _lazy_module(f'{__name__}.urllib3')
+
+from .cache import session_cache
+from .scheduler import poll_scheduler
+from .clock import server_clock
+from .retry import retry_policy, CircuitOpen
+from . import limiter
+from .limiter import rate_limiter
 
 try:
     import _thread as thread
 except:
     import thread
 
-try:
-    import cv2
-    import numpy as np
-
-    def show_image(stream, title=None):
-        img = cv2.imdecode(np.frombuffer(stream, np.uint8), cv2.IMREAD_ANYCOLOR)
-        cv2.imshow('' if title is None else title, img)
-        while cv2.waitKey(0) != -1: pass
-except ModuleNotFoundError:
-    from PIL import Image
-    import io
-
-    def show_image(stream, title=None):
+def show_image(stream, title=None):
+    # The image libraries are loaded only when a captcha shows up.
+    try:
+        import cv2
+        import numpy as np
+    except ModuleNotFoundError:
+        from PIL import Image
+        import io
+
         img = Image.open(io.BytesIO(stream))
         img.show()
-
-from . import urllib3
+        return
+    img = cv2.imdecode(np.frombuffer(stream, np.uint8), cv2.IMREAD_ANYCOLOR)
+    cv2.imshow('' if title is None else title, img)
+    while cv2.waitKey(0) != -1: pass
+
+@functools.lru_cache(maxsize=None)
+def _load_numpy():
+    try:
+        import numpy
+    except ModuleNotFoundError:
+        return None
+    return numpy
 
 class BUAAException(Exception):
     def __init__(self, *args, status=None):
@@ -49,8 +87,12 @@ def _binary_search(v, lst, key=None):
 
 PRODUCT_NAME = 'BUAA Course Grab'
 
+@functools.lru_cache(maxsize=4096)
 def date(s):
-    return datetime.datetime(*time.strptime(s, "%Y-%m-%d %H:%M:%S")[:6])
+    try:
+        return datetime.datetime.fromisoformat(s)
+    except ValueError:
+        return datetime.datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
 
 def date2str(d):
     return d.strftime("%Y-%m-%d %H:%M:%S")
@@ -81,6 +123,32 @@ def url_escape(url):
         url = url.replace(k, v)
     return url
 
+# Every service can be pointed at one host instead, e.g. the local stand-in of
+# buaa.mock: `{base}/sso`, `{base}/vpn`, `{base}/bykc` and `{base}/jwxt`.
+_base_url = os.environ.get('BUAA_BASE_URL', None) or None
+
+def set_base_url(url):
+    global _base_url
+    _base_url = url.rstrip('/') if url else None
+
+def _service_url(name):
+    return f'{_base_url}/{name}' if _base_url is not None else None
+
+class _limited_session(requests.Session):
+    # Every request, redirects included, passes the process-wide rate limiter.
+    def send(self, request, **kwargs):
+        limiter.default.acquire_url(request.url)
+        return super().send(request, **kwargs)
+
+def _session(headers=None, pool_size=4):
+    session = _limited_session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
 def params(url):
     parsed = urllib3.parse_url(url).query
     if parsed is None:
@@ -105,13 +173,47 @@ class CASTGC:
         'Accept-Encoding': 'gzip, deflate, br',
     }
 
-    def __init__(self, username, password, type=None, refresh=False):
+    def __init__(self, username, password, type=None, refresh=False, cache: session_cache=None):
         self.username = username
         self.password = password
         self.type = type
+        self.cache = cache
+        self.http = _session(self.headers)
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.token = None
+        self.execution = None
+        self.data = None
+        self.vpn_cookies = {}
+        self.app_cookies = {}
+        if cache is not None:
+            state = cache.load('castgc')
+            if state is not None:
+                self.restore(state)
         if refresh:
             self.refresh()
 
+    def state(self):
+        return {
+            'token': self.token,
+            'execution': self.execution,
+            'vpn_cookies': self.vpn_cookies,
+            'app_cookies': self.app_cookies,
+        }
+
+    def restore(self, state):
+        self.token = state.get('token', None)
+        self.execution = state.get('execution', None)
+        self.data = {
+            'username': self.username,
+            'password': self.password,
+            'type': 'username_password',
+            'execution': self.execution,
+            '_eventId': 'submit',
+        }
+        self.vpn_cookies = state.get('vpn_cookies', {})
+        self.app_cookies = state.get('app_cookies', {})
+
     @property
     def vpn(self):
         return self.type is not None
@@ -120,10 +222,14 @@ class CASTGC:
     def vpn_login_url(self):
         if self.type is None:
             return None
+        if _service_url('vpn') is not None:
+            return f"{_service_url('vpn')}/users/sign_in"
         return f'https://e{self.type}.buaa.edu.cn/users/sign_in'
 
     @property
     def base_url(self):
+        if _service_url('sso') is not None:
+            return _service_url('sso')
         if self.type is not None:
             return f'https://sso-443.e{self.type}.buaa.edu.cn'
         return 'https://sso.buaa.edu.cn'
@@ -144,8 +250,7 @@ class CASTGC:
         if not self.vpn:
             return
         login_url = self.vpn_login_url
-        res = requests.get(login_url, headers=self.headers)
-        _cookies = res.cookies
+        res = self.http.get(login_url)
         content = res.content.decode('utf8')
         csrf_token = re.search(self.re_webvpn_csrf_token, content).group(1)
 
@@ -158,11 +263,7 @@ class CASTGC:
             'authenticity_token': csrf_token,
         }
 
-        ck = '; '.join(map(lambda x: f"{x[0]}={x[1]}", _cookies.get_dict().items()))
-        res = requests.post(login_url, data=data, headers={
-            'Cookie': ck,
-            **self.headers,
-        }, files=[])
+        res = self.http.post(login_url, data=data, files=[])
         self.vpn_cookies = {}
         for r in res.history:
             self.vpn_cookies.update(r.cookies.get_dict())
@@ -172,21 +273,30 @@ class CASTGC:
             'username': self.username,
             'password': self.password,
         }
-        res = requests.post(f'{self.app_url}/check', data=data, headers=self.headers)
+        res = self.http.post(f'{self.app_url}/check', data=data)
         res_data = json.loads(res.content.decode('utf8'))
         suc = res_data['e'] == 0
         if not suc:
             raise BUAAException(f'Login error: {res_data.get("m", "Unknown Error")}')
         self.app_cookies = res.cookies.get_dict()
 
+    def renew(self, generation=None):
+        # Several service clients may share one token; whoever gets the lock first
+        # performs the full login and the others reuse its result.
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self.refresh()
+            return True
+
     def refresh(self):
         login_url = self.login_url
         captcha_url = self.captcha_url
 
-        headers = self.headers
-
-        res = requests.get(login_url, headers=headers)
-        _cookies = res.cookies
+        # A full login starts from a clean jar, otherwise CAS recognizes the old
+        # ticket-granting cookie and never serves the login form.
+        self.http.cookies.clear()
+        res = self.http.get(login_url)
         content = res.content.decode('utf8')
         execution = re.search(self.re_execution, content).group(1)
 
@@ -198,26 +308,18 @@ class CASTGC:
             '_eventId': 'submit',
         }
 
-        ck = '; '.join(map(lambda x: f"{x[0]}={x[1]}", _cookies.get_dict().items()))
-
         _CASTGC = None
         while _CASTGC is None:
             captcha_id = re.search(self.re_cas_captcha_id, content)
             if captcha_id is not None:
                 captcha_id = captcha_id.group(1)
-                captcha_pic = requests.get(f'{captcha_url}{captcha_id}', headers={
-                    'Cookie': ck,
-                    **headers,
-                }).content
+                captcha_pic = self.http.get(f'{captcha_url}{captcha_id}').content
                 thread.start_new(show_image, (captcha_pic, 'Captcha'))
 
                 captcha_answer = input('Input captcha: ')
                 data['captcha'] = captcha_answer
 
-            res = requests.post(login_url, data=data, headers={
-                'Cookie': ck,
-                **headers,
-            }, files=[], allow_redirects=False)
+            res = self.http.post(login_url, data=data, files=[], allow_redirects=False)
             _CASTGC = res.cookies.get('CASTGC')
 
             if _CASTGC is None:
@@ -230,6 +332,7 @@ class CASTGC:
         self.token = _CASTGC
         self.execution = execution
         self.data = data
+        self.generation += 1
 
         self.vpn_cookies = {}
         self.refresh_webvpn()
@@ -237,48 +340,154 @@ class CASTGC:
         self.app_cookies = {}
         #self.refresh_app()
 
+        if self.cache is not None:
+            self.cache.store('castgc', self.state())
+
 class login:
-    def __init__(self, url, token):
+    cache_name = 'login'
+    max_age = 3600  # seconds after which a session is renewed proactively
+    max_idle = 600  # seconds after which an unused session is checked again
+
+    def __init__(self, url, token, cache: session_cache=None, retry: retry_policy=None):
         self.token = token
-        self.refresh(url)
+        self.cache = cache
+        self.retry = retry if retry is not None else retry_policy()
+        self.http = _session(token.headers)
+        self.target = url
+        self.refreshed_at = self.used_at = time.monotonic()
+        self.url = None
+        self.cookies = {}
+        self.session = None
+        self.recovery_stats = {'ticket': 0, 'login': 0, 'cache': 0}
+        self.clock = server_clock()
+        if not self.restore_cached():
+            self.refresh(url)
+
+    def state(self):
+        return {
+            'url': self.url,
+            'cookies': self.cookies,
+            'jar': [(c.name, c.value, c.domain, c.path) for c in self.http.cookies],
+        }
+
+    def restore(self, state):
+        self.url = state['url']
+        self.cookies = state.get('cookies', {})
+        self.session = self.cookies.get('JSESSIONID', None)
+        self.http.cookies.clear()
+        for name, value, domain, path in state.get('jar', []):
+            self.http.cookies.set(name, value, domain=domain, path=path)
 
-    def refresh(self, url):
+    def validate(self):
+        return True
+
+    def restore_cached(self):
+        if self.cache is None:
+            return False
+        state = self.cache.load(self.cache_name)
+        if state is None:
+            return False
+        try:
+            self.restore(state)
+            if not self.validate():
+                return False
+        except Exception:
+            return False
+        self.refreshed_at = time.monotonic() - (self.cache.age(self.cache_name) or 0)
+        self.recovery_stats['cache'] += 1
+        return True
+
+    def save(self):
+        if self.cache is not None:
+            self.cache.store(self.cache_name, self.state())
+
+    def refresh(self, url=None):
+        # Exchange the existing CASTGC for a new service ticket first, and only
+        # fall back to a full CAS login when CAS rejects the cookie.
+        if url is None:
+            url = self.target
+        token = self.token
+        generation = token.generation
+        # A failed exchange, e.g. a 5xx, is retried as such; only a login form in
+        # return means the cookie is no longer accepted.
+        if token.token is not None and self.retry.call('sso/ticket', lambda: self.service_login(url),
+                                                       accept=lambda res: True):
+            self.recovery_stats['ticket'] += 1
+        else:
+            token.renew(generation)
+            self.recovery_stats['login'] += 1
+            self.service_login(url)
+        self.refreshed_at = time.monotonic()
+        self.save()
+
+    def service_login(self, url):
         token = self.token
-        token.refresh()
         url = token.login_url + f"?TARGET={url_escape(url)}"
-        res = requests.post(
+        self.http.cookies.clear()
+        self.http.cookies.update({**token.vpn_cookies, **token.app_cookies})
+        res = self.http.post(
             url,
             data=token.data,
-            cookies={
-                'CASTGC': token.token,
-                **token.vpn_cookies,
-            },
-            headers={
-                **token.headers,
-            },
+            cookies={'CASTGC': token.token},
             files=[],
         )
+        self.url = res.url
+        if not res.history or res.url.startswith(token.login_url):
+            if res.status_code == 200 and re.search(token.re_execution, res.text) is not None:
+                return False
+            raise BUAAException(f'Service login returns status code {res.status_code}')
+        if res.status_code >= 400:
+            raise BUAAException(f'Service login returns status code {res.status_code}')
         cookies = {**token.vpn_cookies, **token.app_cookies}
         for his in res.history[1:]:
             cookies.update(his.cookies.get_dict())
-        self.url = res.url
         self.cookies = cookies
         self.session = cookies.get('JSESSIONID', None)
+        return True
 
-    def post(self, *args, cookies=None, headers=None, **kwargs):
-        if headers is None:
-            headers = {}
-        if cookies is None:
-            cookies = {}
-        return requests.post(*args, cookies={**cookies, **self.cookies}, headers={**headers, **self.headers}, **kwargs)
-
-    def get(self, *args, cookies=None, headers=None, **kwargs):
-        if headers is None:
-            headers = {}
-        if cookies is None:
-            cookies = {}
-        return requests.get(*args, cookies={**cookies, **self.cookies}, headers={**headers, **self.headers},
-                            **kwargs)
+    def post(self, *args, **kwargs):
+        sent = time.time()
+        res = self.http.post(*args, **kwargs)
+        self.clock.observe(res, sent, time.time())
+        self.used_at = time.monotonic()
+        return res
+
+    def get(self, *args, **kwargs):
+        sent = time.time()
+        res = self.http.get(*args, **kwargs)
+        self.clock.observe(res, sent, time.time())
+        self.used_at = time.monotonic()
+        return res
+
+    def now(self):
+        return self.clock.now()
+
+    @property
+    def age(self):
+        return time.monotonic() - self.refreshed_at
+
+    @property
+    def idle(self):
+        return time.monotonic() - self.used_at
+
+    @property
+    def stale(self):
+        return self.age > self.max_age
+
+    def warm(self, force=False):
+        # Renews a session that is too old or no longer accepted, so that the
+        # next time-critical request neither fails first nor pays for the login
+        # and connection setup. A fresh session in use is left alone unless
+        # `force` is given.
+        if not force and not self.stale and self.idle < self.max_idle:
+            return False
+        if self.stale or not self.validate():
+            self.refresh()
+        return True
+
+    def diagnostics(self):
+        return {'recovery': dict(self.recovery_stats), 'clock': self.clock.stats(), 'age': self.age,
+                'retry': dict(self.retry.stats), 'limiter': limiter.default.report()}
 
     @property
     def headers(self):
@@ -297,40 +506,23 @@ college_calendar_day_re = re.compile(
     r'<td\s+align="center"\s+class="sk_green">\s*([0-9]+)'
 )
 
-timetable_re = re.compile(
-    r'<tr (?:class="[A-Za-z0-9- ]+")?>\s*' + \
-    r'<td[^>]*>[\S\s]*?</td>\s*' * 2 + \
-    r'<td[^>]*>([\S\s]*?)</td>\s*' * 7 + \
-    r'</tr>'
+places_re = re.compile(
+    r'<input id="xkyq_([^"]*)" type="hidden" value=""/>\s*([0-9]+)/([0-9]+)[^0-9]+?([0-9]+)/([0-9]+)'
 )
 
-timespan_re = r'(?:[0-9]+(?:-[0-9]+)?(?:[,，][0-9]+(?:-[0-9]+)?)*)'
 timespan_grouped_re = r'([0-9]+(?:-[0-9]+)?(?:[,，][0-9]+(?:-[0-9]+)?)*)'
 timespan_single_re = r'([0-9]+)(?:-([0-9]+))?'
 
-week_single_re = rf'(?:[^\]]*\[{timespan_re}\]周?)'
-week_single_grouped_re = re.compile(rf'^(?:([^\]]*)\[{timespan_grouped_re}\]周?)')
-
-week_re = rf'(?:{week_single_re}(?:[,，]{week_single_re})*)'
-week_grouped_re = rf'({week_single_re}(?:[,，]{week_single_re})*)'
-
-timetable_item_re = rf'{week_re}[\S\s]*?第{timespan_re}节'
-timetable_item_grouped_re = rf'{week_grouped_re}(?:</br>)?([\S\s]*?)\s*第{timespan_grouped_re}节'
-
-timetable_all_re = re.compile(
-    r'([^<]*)\s*'
-    r'</br>\s*' + \
-    rf'({timetable_item_re}(?:[,，]{timetable_item_re})*)'
-)
-
 class bykc(login):
     class course:
         RE_POS_SHAHE = r'(?:(?:J|S|教|实|实验楼)[0-5]|沙河|咏曼)'
         RE_POS_XUEYUANROAD = r'(?:[A-H][0-9]{3,4}|学院路|学术交流厅|主|[(（][1-5一二三四五][)）]|^体育场)'
 
+        __slots__ = ('id', 'campus', 'college', 'provider', 'current', 'max', 'name', 'teacher',
+                     'select_start', 'select_end', 'start', 'end', 'classroom', 'desc')
+
         def __init__(self, data):
             self.id = data['id']
-            self.data = data
             try:
                 self.campus = json.loads(data['courseCampus'])
             except:
@@ -348,14 +540,19 @@ class bykc(login):
             self.classroom = data['coursePosition']
             self.desc = data.get('courseDesc', None)
 
-        @property
-        def position(self):
-            if re.search(self.RE_POS_SHAHE, self.classroom):
+        @staticmethod
+        @functools.lru_cache(maxsize=1024)
+        def classify(classroom):
+            if re.search(bykc.course.RE_POS_SHAHE, classroom):
                 return 's'
-            if re.search(self.RE_POS_XUEYUANROAD, self.classroom):
+            if re.search(bykc.course.RE_POS_XUEYUANROAD, classroom):
                 return 'x'
             return 'x'
 
+        @property
+        def position(self):
+            return self.classify(self.classroom)
+
         def __str__(self):
             return \
                 f"{self.id} {self.name} {self.teacher}\n" \
@@ -368,8 +565,50 @@ class bykc(login):
         def __repr__(self):
             return str(self)
 
+    # Maps course IDs to raw entries and only builds a course when the ID is read.
+    # Records built from an entry are shared through `built` with later maps holding
+    # the very same entry object.
+    class course_map(collections.abc.MutableMapping):
+        def __init__(self, data=(), factory=None, built=None):
+            self.factory = factory if factory is not None else bykc.course
+            self.built = built
+            self._items = {c['id']: c for c in data}
+
+        def __getitem__(self, id):
+            item = self._items[id]
+            if isinstance(item, dict):
+                built = self.built.get(id, None) if self.built is not None else None
+                if built is not None and built[0] is item:
+                    course = built[1]
+                else:
+                    course = self.factory(item)
+                    if self.built is not None:
+                        self.built[id] = (item, course)
+                item = self._items[id] = course
+            return item
+
+        def __setitem__(self, id, value):
+            self._items[id] = value
+
+        def __delitem__(self, id):
+            del self._items[id]
+
+        def __iter__(self):
+            return iter(self._items)
+
+        def __len__(self):
+            return len(self._items)
+
+        def __contains__(self, id):
+            return id in self._items
+
+        def __repr__(self):
+            return repr(dict(self.items()))
+
     @property
     def weburl(self):
+        if _service_url('bykc') is not None:
+            return _service_url('bykc')
         if self.token and self.token.type is not None:
             return f'https://bykc.e{self.token.type}.buaa.edu.cn'
         return 'http://bykc.buaa.edu.cn'
@@ -378,39 +617,104 @@ class bykc(login):
     def loginurl(self):
         return f'{self.weburl}/sscv/casLogin'
 
-    def __init__(self, *args, retry_limit=16, **kwargs):
-        self.token = CASTGC(*args, **kwargs)
+    cache_name = 'bykc'
+
+    # Seconds for which a response is reused. Entries of list endpoints are dropped
+    # as soon as an enroll or drop is issued; polling loops also drop them at the
+    # start of every round, as their interval may be shorter than the TTL.
+    cache_ttl = {
+        'querySelectableCourse': 0.5,
+        'queryForeCourse': 0.5,
+        'queryChosenCourse': 0.5,
+        'queryCourseById': 60,
+    }
+
+    def __init__(self, *args, retry_limit=16, token: CASTGC=None, cache: session_cache=None, cache_ttl=None,
+                 retry: retry_policy=None, **kwargs):
+        self.token = token if token is not None else CASTGC(*args, cache=cache, **kwargs)
         self.retry_limit = retry_limit
-        super().__init__(self.loginurl, self.token)
-        self.bykc_token = params(self.url)
-        while self.bykc_token is None:
-            self.refresh()
-        self.bykc_token = self.bykc_token.get('token', None)
+        self.bykc_token = None
+        self.envelope = bykc_encrypt.envelope()
+        self.cache_ttl = {**self.cache_ttl, **(cache_ttl or {})}
+        self.cache_stats = {'hit': 0, 'miss': 0}
+        self.responses = {}
+        self.records = {}
+        self.digests = {}
+        self.snapshots = {}
+        self.built = {}
+        if retry is None:
+            retry = retry_policy(attempts=retry_limit + 1)
+        super().__init__(self.loginurl, self.token, cache=cache, retry=retry)
 
     def refresh(self, url=None):
         super().refresh(self.loginurl)
 
+    def service_login(self, url):
+        res = super().service_login(url)
+        self.envelope = bykc_encrypt.envelope()
+        self.invalidate()
+        bykc_token = params(self.url).get('token', None)
+        if bykc_token is not None:
+            self.bykc_token = bykc_token
+        self.http.headers['auth_token'] = self.bykc_token
+        return res
+
+    def state(self):
+        return {**super().state(), 'bykc_token': self.bykc_token}
+
+    def restore(self, state):
+        super().restore(state)
+        self.bykc_token = state.get('bykc_token', None)
+        self.http.headers['auth_token'] = self.bykc_token
+
+    def validate(self):
+        try:
+            self.__encrypted_api('queryChosenCourse')
+        except Exception:
+            return False
+        return True
+
     @property
     def headers(self):
         return {'auth_token': self.bykc_token, **super().headers}
 
-    def query(self, name, default=None, throw=False):
-        if default is None: default = []
-        try:
-            res = self.__encrypted_api(name)
-            if res is None:
-                res = default
+    def diagnostics(self):
+        return {**super().diagnostics(), 'cache': dict(self.cache_stats)}
+
+    @staticmethod
+    def retryable(e):
+        # Status 1 is a refusal of the request itself, e.g. an unknown course or a
+        # full one, which no retry can change.
+        return not isinstance(e, BUAAException) or e.status != '1'
+
+    # Outcomes of an enrollment or a drop.
+    DONE, REFUSED, FAILED = 'done', 'refused', 'failed'
+
+    def __retry(self, name, fn, **kwargs):
+        return self.retry.call(f'bykc/{name}', fn, retryable=self.retryable, **kwargs)
+
+    def invalidate(self, name=None):
+        if name is None:
+            self.responses.clear()
+        else:
+            self.responses.pop(name, None)
+
+    def __cached(self, entry, ttl):
+        if entry is not None and time.monotonic() - entry[0] <= ttl:
+            self.cache_stats['hit'] += 1
+            return entry[1]
+        self.cache_stats['miss'] += 1
+        return None
+
+    @limiter.prioritized(limiter.PRIORITY_POLL)
+    def query(self, name):
+        # Failures are raised, so that the retry policy of the caller sees them and
+        # decides whether to renew the session and try again.
+        res = self.__cached(self.responses.get(name, None), self.cache_ttl.get(name, 0))
+        if res is not None:
             return res
-        except:
-            self.refresh()
-        try:
-            res = self.__encrypted_api(name)
-        except:
-            if throw:
-                raise
-            res = None
-        if res is None:
-            res = default
+        res = self.__encrypted_api(name)
+        self.responses[name] = (time.monotonic(), res)
         return res
 
     def __encrypted_api(self, name, payload=None):
@@ -421,17 +725,16 @@ class bykc(login):
         #raw_data = json.dumps(payload, ensure_ascii=True)
 
         raw_data_bytes = raw_data.encode('utf8')
-        aes_key = bykc_encrypt.generate_aes_key()
-        data_sign = bykc_encrypt.sign(raw_data_bytes)
-        timestamp = int(time.time() * 1000)
+        envelope = self.envelope
+        timestamp = int(self.clock.time() * 1000)
         headers = {
             'Content-Type': 'application/json;charset=UTF-8',
-            'ak': bykc_encrypt.rsa_encrypt(aes_key).decode('utf8'),
-            'sk': bykc_encrypt.rsa_encrypt(data_sign).decode('utf8'),
+            'ak': envelope.ak,
+            'sk': envelope.signature(raw_data_bytes),
             'ts': str(timestamp),
         }
 
-        encrypted_data = bykc_encrypt.b64encode(bykc_encrypt.aes_encrypt(raw_data_bytes, aes_key))
+        encrypted_data = bykc_encrypt.b64encode(envelope.encrypt(raw_data_bytes))
         res = self.post(
             f'{self.weburl}/sscv/{name}',
             data=encrypted_data,
@@ -449,53 +752,107 @@ class bykc(login):
             status = res_decode.get('status', None)
             raise BUAAException(f'API {name} returns error status {status} with data {res_decode.get("data", None)}', status=status)
         try:
-            res_decode = json.loads(bykc_encrypt.aes_decrypt(content, aes_key))
+            content = envelope.decrypt(content)
+            digest = hashlib.blake2b(content, digest_size=16).digest()
+            last = self.digests.get(name, None) if not payload else None
+            if last is not None and last[0] == digest:
+                # Identical payload: hand out the previously decoded data object.
+                return last[1]
+            res_decode = json.loads(content)
         except ValueError:
             raise BUAAException(f'API {name} returns invalid data {content}')
         status = res_decode.get('status', None)
         if status != '0':
             raise BUAAException(f'API {name} returns error status {status} with data {res_decode.get("data", None)}', status=status)
-        return res_decode.get('data', None)
+        data = res_decode.get('data', None)
+        if not payload:
+            self.digests[name] = (digest, data)
+        return data
 
     def api(self, name, payload=None):
         if payload is None: payload = {}
         try:
             return self.__encrypted_api(name=name, payload=payload)
-        except:
+        except Exception as e:
+            # A refusal, e.g. of a full course, says nothing about the session.
+            if not self.retryable(e):
+                raise
             self.refresh()
         return self.__encrypted_api(name=name, payload=payload)
 
     def courses(self, data):
-        res = {}
+        now = time.monotonic()
         for c in data:
-            res[c['id']] = self.course(c)
-        return res
+            self.records[c['id']] = (now, c)
+        return self.course_map(data, self.course, self.built)
+
+    class delta:
+        __slots__ = ('added', 'removed', 'capacity', 'rescheduled', 'changed')
+
+        def __init__(self, added=(), removed=(), capacity=(), rescheduled=(), changed=()):
+            self.added = set(added)
+            self.removed = set(removed)
+            self.capacity = set(capacity)
+            self.rescheduled = set(rescheduled)
+            self.changed = set(changed)
+
+        def __bool__(self):
+            return bool(self.added or self.removed or self.changed)
+
+        def __repr__(self):
+            return f'delta(added={self.added}, removed={self.removed}, capacity={self.capacity}, ' \
+                   f'rescheduled={self.rescheduled}, changed={self.changed})'
+
+    @staticmethod
+    def fingerprint(data):
+        return (
+            (data.get('courseCurrentCount', None), data.get('courseMaxCount', None)),
+            (data.get('courseSelectStartDate', None), data.get('courseSelectEndDate', None),
+             data.get('courseStartDate', None), data.get('courseEndDate', None)),
+            hash(json.dumps(data, sort_keys=True)),
+        )
+
+    def poll(self, name='querySelectableCourse'):
+        # Returns the course list together with the changes since the previous poll
+        # of the same endpoint. An unchanged payload costs no fingerprinting at all.
+        res = self.__retry(name, lambda: self.query(name), recover=self.refresh)
+        if res is None: raise BUAAException(f'Failed to poll {name}')
+        last = self.snapshots.get(name, None)
+        if last is not None and last[0] is res:
+            return self.courses(res), self.delta()
+        prints = {c['id']: self.fingerprint(c) for c in res}
+        old = last[1] if last is not None else {}
+        delta = self.delta(added=prints.keys() - old.keys(), removed=old.keys() - prints.keys())
+        for id in prints.keys() & old.keys():
+            new_print, old_print = prints[id], old[id]
+            if new_print[2] == old_print[2]:
+                continue
+            delta.changed.add(id)
+            if new_print[0] != old_print[0]:
+                delta.capacity.add(id)
+            if new_print[1] != old_print[1]:
+                delta.rescheduled.add(id)
+        self.snapshots[name] = (res, prints)
+        return self.courses(res), delta
 
     @property
     def forecast(self):
-        res = None
-        for _ in range(self.retry_limit + 1):
-            res = self.query('queryForeCourse', None)
-            if res is not None: break
+        res = self.__retry('queryForeCourse', lambda: self.query('queryForeCourse'),
+                           recover=self.refresh)
         if res is None: raise BUAAException('Failed to get forecast')
         return self.courses(res)
 
     @property
     def selectable(self):
-        res = None
-        for _ in range(self.retry_limit + 1):
-            res = self.query('querySelectableCourse', None)
-            if res is not None: break
+        res = self.__retry('querySelectableCourse', lambda: self.query('querySelectableCourse'),
+                           recover=self.refresh)
         if res is None: raise BUAAException('Failed to get selectable course list')
         return self.courses(res)
 
     @property
     def history(self):
-        res = None
-        for _ in range(self.retry_limit + 1):
-            res = self.query('queryChosenCourse', None)
-            if res is None or not isinstance(res, dict): self.refresh()
-            else: break
+        res = self.__retry('queryChosenCourse', lambda: self.query('queryChosenCourse'),
+                           accept=lambda res: isinstance(res, dict), recover=self.refresh)
         if res is None or not isinstance(res, dict): raise BUAAException('Failed to get history')
         res = res.get('historyCourseList', [])
         _res = []
@@ -507,11 +864,8 @@ class bykc(login):
 
     @property
     def chosen(self):
-        res = None
-        for _ in range(self.retry_limit + 1):
-            res = self.query('queryChosenCourse', None)
-            if res is None or not isinstance(res, dict): self.refresh()
-            else: break
+        res = self.__retry('queryChosenCourse', lambda: self.query('queryChosenCourse'),
+                           accept=lambda res: isinstance(res, dict), recover=self.refresh)
         if res is None or not isinstance(res, dict): raise BUAAException('Failed to get chosen courses')
         res = res.get('courseList', [])
         _res = []
@@ -521,40 +875,62 @@ class bykc(login):
                 _res.append(cc)
         return self.courses(_res)
 
+    @limiter.prioritized(limiter.PRIORITY_POLL)
     def detail(self, id, throw=False):
-        res = None
-        for _ in range(self.retry_limit + 1):
-            try:
-                res = self.api('queryCourseById', {'id': id})
-            except BUAAException as e:
-                res = None
-                if e.status == '1':
-                    break
-                if throw:
-                    raise
-            if res is not None: break
-        if res is None: raise BUAAException('Failed to get course detail')
-        return self.course(res)
-
-    def enroll(self, id, throw=False):
+        res = self.__cached(self.records.get(id, None), self.cache_ttl.get('queryCourseById', 0))
+        if res is not None:
+            return self.course(res)
         try:
-            res = self.api('choseCourse', {'courseId': id})
-        except:
+            res = self.__retry('queryCourseById', lambda: self.api('queryCourseById', {'id': id}))
+        except BUAAException:
             if throw:
                 raise
             res = None
-        if res is None: return False
-        return id in self.chosen
+        if res is None: raise BUAAException('Failed to get course detail')
+        self.records[id] = (time.monotonic(), res)
+        return self.course(res)
 
-    def drop(self, id, throw=False):
+    def __action(self, name, payload, throw=False):
         try:
-            res = self.api('delChosenCourse', {'id': id})
-        except:
+            res = self.api(name, payload)
+        except Exception as e:
             if throw:
                 raise
-            res = None
-        if res is None: return False
-        return id not in self.chosen
+            return self.FAILED if self.retryable(e) else self.REFUSED
+        finally:
+            self.invalidate()
+        return self.DONE if res is not None else self.FAILED
+
+    @limiter.prioritized(limiter.PRIORITY_ACTION)
+    def outcomes(self, enroll=(), drop=(), throw=False):
+        # Runs all actions first, then verifies every one of them against a single
+        # snapshot of chosen courses. A refusal, e.g. of a full course, is final,
+        # while a failure may be retried.
+        enroll, drop = list(enroll), list(drop)
+        res = {}
+        for id in enroll:
+            res[id] = self.__action('choseCourse', {'courseId': id}, throw)
+        for id in drop:
+            res[id] = self.__action('delChosenCourse', {'id': id}, throw)
+        if self.DONE not in res.values():
+            return res
+        chosen = self.chosen
+        for id in enroll:
+            if res[id] == self.DONE and id not in chosen:
+                res[id] = self.FAILED
+        for id in drop:
+            if res[id] == self.DONE and id in chosen:
+                res[id] = self.FAILED
+        return res
+
+    def batch(self, enroll=(), drop=(), throw=False):
+        return {id: status == self.DONE for id, status in self.outcomes(enroll, drop, throw).items()}
+
+    def enroll(self, id, throw=False):
+        return self.batch(enroll=[id], throw=throw)[id]
+
+    def drop(self, id, throw=False):
+        return self.batch(drop=[id], throw=throw)[id]
 
 
 class jwxt(login):
@@ -569,6 +945,8 @@ class jwxt(login):
 
     @property
     def weburl(self):
+        if _service_url('jwxt') is not None:
+            return _service_url('jwxt')
         if self.token and self.token.type is not None:
             return f'https://jwxt-8080.e{self.token.type}.buaa.edu.cn'
         return 'http://jwxt.buaa.edu.cn:8080'
@@ -581,15 +959,25 @@ class jwxt(login):
     def path_id(self):
         return 'ieas2.1'
 
-    def __init__(self, *args, **kwargs):
-        self.token = CASTGC(*args, **kwargs)
-        super().__init__(self.loginurl, self.token)
+    cache_name = 'jwxt'
+
+    def __init__(self, *args, token: CASTGC=None, cache: session_cache=None, retry: retry_policy=None, **kwargs):
+        self.token = token if token is not None else CASTGC(*args, cache=cache, **kwargs)
         self.__token_re = re.compile('<input type="hidden" id="token" name="token" value="([0-9.]*)" />')
+        self.verify_stats = {'avoided': 0, 'checked': 0}
+        super().__init__(self.loginurl, self.token, cache=cache, retry=retry)
 
     def refresh(self, url=None):
         super().refresh(self.loginurl)
 
-    def choose(self, year, season, course_id: str, course_type='ZY', tail='001', *, external=False, wish=None, weight=None, verbose=False):
+    def validate(self):
+        res = self.get(self.loginurl, allow_redirects=False)
+        return res.status_code == 200
+
+    def diagnostics(self):
+        return {**super().diagnostics(), 'verify': dict(self.verify_stats)}
+
+    def __selection_list(self, year, season, course_id: str, course_type='ZY', verbose=False):
         if len(course_id) < 9 or len(course_id) > 10:
             raise BUAAException('Invalid course ID')
         course_id = course_id.upper()
@@ -601,7 +989,6 @@ class jwxt(login):
             course_type = 'J'
         _season = min(season, 2)
         head = '%04d-%04d' % (year - _season + 1, year - _season + 2)
-        cid = f"{head}-{season}-{course_id}-{tail}"
 
         data = {
             'token': '',
@@ -630,47 +1017,104 @@ class jwxt(login):
             'Origin': self.weburl,
             'Content-Type': 'application/x-www-form-urlencoded',
         }
-        if wish is not None:
-            data['zy'] = str(wish)
-        if weight is not None:
-            data['qz'] = str(min(max(weight, 0), 100))
-
-        places_re = f'<input id="xkyq_{cid}" type="hidden" value=""/>\\s*([0-9]+)/([0-9]+)[^0-9]+?([0-9]+)/([0-9]+)'
-        places_re = re.compile(places_re)
 
-        choice_token = None
-        while choice_token is None:
+        def fetch():
             form = self.post(f'{self.weburl}/{self.path_id}/xslbxk/queryXsxkList', data=payload,
                              headers=headers).content.decode('utf8')
-
             if form.find('</form>') < 0:
-                if verbose:
-                    print('Refreshing cookies.')
-                self.refresh()
-                continue
+                raise BUAAException('Failed to get the course selection page')
+            return form
+
+        def recover():
+            if verbose:
+                print('Refreshing cookies.')
+            self.refresh()
+
+        form = self.retry.call('jwxt/queryXsxkList', fetch, recover=recover)
+        return data, headers, form
+
+    @classmethod
+    def places(cls, form):
+        # Seat counts of every course section on a selection page, in one pass.
+        return {m.group(1): tuple(map(int, m.group(2, 3, 4, 5))) for m in re.finditer(places_re, form)}
+
+    @classmethod
+    def _rest(cls, places, external=False):
+        if external:
+            return places[3] - places[2]
+        return places[1] - places[0]
+
+    @limiter.prioritized(limiter.PRIORITY_POLL)
+    def watch(self, year, season, targets, course_type=None, *, external=False, verbose=False):
+        # Remaining seats of each (course_id, tail) target, or None when the section
+        # is not listed. Sections sharing a course ID cost one page fetch.
+        _season = min(season, 2)
+        head = '%04d-%04d' % (year - _season + 1, year - _season + 2)
+        groups = {}
+        for course_id, tail in targets:
+            groups.setdefault(course_id.upper(), []).append((course_id, tail))
+        res = {}
+        for course_id, group in groups.items():
+            typ = course_type if course_type is not None else self.course_type(course_id[2])
+            _, _, form = self.__selection_list(year, season, course_id, typ, verbose=verbose)
+            places = self.places(form)
+            for target in group:
+                p = places.get(f"{head}-{season}-{course_id}-{target[1]}", None)
+                res[target] = None if p is None else self._rest(p, external)
+        return res
 
-            places = re.search(places_re, form)
+    @limiter.prioritized(limiter.PRIORITY_ACTION)
+    def choose(self, year, season, course_id: str, course_type='ZY', tail='001', *, external=False, wish=None, weight=None, verbose=False):
+        if len(course_id) < 9 or len(course_id) > 10:
+            raise BUAAException('Invalid course ID')
+        if course_type + 'L' not in ('JCL', 'TSL', 'ZYL'):
+            raise BUAAException('Invalid course type')
+        course_id = course_id.upper()
+        _season = min(season, 2)
+        head = '%04d-%04d' % (year - _season + 1, year - _season + 2)
+        cid = f"{head}-{season}-{course_id}-{tail}"
+
+        def attempt():
+            # Returns the outcome when it is known before saving, or the access token.
+            data, headers, form = self.__selection_list(year, season, course_id, course_type, verbose=verbose)
+
+            places = self.places(form).get(cid, None)
             if places is None:
-                return self.enrolled(year, season, course_id, tail)
-            if external:
-                rest = int(places.group(4)) - int(places.group(3))
-            else:
-                rest = int(places.group(2)) - int(places.group(1))
-            if rest <= 0:
-                return False
+                return self.enrolled(year, season, course_id, tail), None
+            if self._rest(places, external) <= 0:
+                return False, None
 
             choice_token = re.search(self.__token_re, form)
             if choice_token is not None:
-                choice_token = choice_token.group(1)
-            elif verbose:
+                return (data, headers), choice_token.group(1)
+            if verbose:
                 print('Failed to get access token. Retrying.')
+            return None, None
+
+        # Only a page without access token is worth another attempt here; errors
+        # left over from the retries of the selection page are final.
+        res, choice_token = self.retry.call('jwxt/choose', attempt, accept=lambda res: res[0] is not None,
+                                            retryable=lambda e: not isinstance(e, BUAAException))
+        if choice_token is None:
+            if res is None:
+                raise BUAAException('Failed to get access token')
+            return res
+        data, headers = res
+        if wish is not None:
+            data['zy'] = str(wish)
+        if weight is not None:
+            data['qz'] = str(min(max(weight, 0), 100))
         data['token'] = choice_token
         data['rwh'] = cid
         payload1 = '&'.join(map(lambda x: f"{url_escape(x[0])}={url_escape(x[1])}", data.items()))
-        self.post(f'{self.weburl}/{self.path_id}/xslbxk/saveXsxk', data=payload1, headers=headers)
+        res = self.post(f'{self.weburl}/{self.path_id}/xslbxk/saveXsxk', data=payload1, headers=headers)
+        outcome = self.__outcome(res, cid)
+        if outcome is not None:
+            return outcome
 
         return self.enrolled(year, season, course_id, tail)
 
+    @limiter.prioritized(limiter.PRIORITY_ACTION)
     def drop(self, year, season, course_id: str, tail='001'):
         if len(course_id) < 9 or len(course_id) > 10:
             raise BUAAException('Invalid course ID')
@@ -699,10 +1143,24 @@ class jwxt(login):
             'Origin': self.weburl,
             'Content-Type': 'application/x-www-form-urlencoded',
         }
-        self.post(f'{self.weburl}/{self.path_id}/xslbxk/saveXstk', data=payload, headers=headers)
+        res = self.post(f'{self.weburl}/{self.path_id}/xslbxk/saveXstk', data=payload, headers=headers)
+        outcome = self.__outcome(res, cid)
+        if outcome is not None:
+            return not outcome
 
         return not self.enrolled(year, season, course_id, tail)
 
+    def __outcome(self, res, cid):
+        # Whether `cid` is enrolled according to the response of a save or drop, or
+        # None if the response is not the enrolled course list. That list posts
+        # back to queryYxkc and, unlike the selection page, has no seat fields;
+        # anything else is checked with a separate request.
+        page = res.content
+        if page.find(b'xslbxk/queryYxkc') < 0 or page.find(b'id="xkyq_') >= 0:
+            return None
+        self.verify_stats['avoided'] += 1
+        return page.find(f'id="{cid}"'.encode('utf8')) >= 0
+
     def enrolled(self, year, season, course_id: str, tail='001'):
         if len(course_id) < 9 or len(course_id) > 10:
             raise BUAAException('Invalid course ID')
@@ -727,9 +1185,22 @@ class jwxt(login):
             'Content-Type': 'application/x-www-form-urlencoded',
         }
         payload = '&'.join(map(lambda x: f"{url_escape(x[0])}={url_escape(x[1])}", data.items()))
-        form = self.post(f'{self.weburl}/{self.path_id}/xslbxk/queryYxkc', data=payload,
-                         headers=headers).content.decode('utf8')
-        return form.find(f'id="{cid}"') >= 0
+        self.verify_stats['checked'] += 1
+        # Scan the page as it arrives and stop searching once the ID shows up. The
+        # rest is still read, otherwise the keep-alive connection would be closed
+        # instead of returned to the pool.
+        needle = f'id="{cid}"'.encode('utf8')
+        tail = b''
+        found = False
+        with self.post(f'{self.weburl}/{self.path_id}/xslbxk/queryYxkc', data=payload, headers=headers,
+                       stream=True) as res:
+            for chunk in res.iter_content(chunk_size=16384):
+                if found:
+                    continue
+                chunk = tail + chunk
+                found = chunk.find(needle) >= 0
+                tail = chunk[-len(needle) + 1:]
+        return found
 
     def export_timetable(self, year, season, file: str=None):
         attachment_re = re.compile(r'^attachment;\s+filename="([^"]*)"$')
@@ -791,49 +1262,158 @@ class jwxt(login):
         def __repr__(self):
             return str(self)
 
+    # Columnar timetable: int64 start seconds plus interned course name and teacher
+    # IDs. Indexing and iteration yield course_time objects for compatibility.
+    class course_table(collections.abc.Sequence):
+        def __init__(self, first_day=None):
+            self.first_day = first_day
+            self.starts = array.array('q')
+            self.names = array.array('l')
+            self.teachers = array.array('l')
+            self.name_table = []
+            self.teacher_table = []
+            self._ids = ({}, {})
+            self._busy = None
+
+        def state(self):
+            return {
+                'first_day': date2str(self.first_day) if self.first_day is not None else None,
+                'starts': self.starts.tolist(),
+                'names': self.names.tolist(),
+                'teachers': self.teachers.tolist(),
+                'name_table': self.name_table,
+                'teacher_table': self.teacher_table,
+            }
+
+        @classmethod
+        def from_state(cls, state):
+            first_day = state.get('first_day', None)
+            res = cls(date(first_day) if first_day is not None else None)
+            res.starts = array.array('q', state['starts'])
+            res.names = array.array('l', state['names'])
+            res.teachers = array.array('l', state['teachers'])
+            res.name_table = list(state['name_table'])
+            res.teacher_table = list(state['teacher_table'])
+            res._ids = (
+                {v: i for i, v in enumerate(res.name_table)},
+                {v: i for i, v in enumerate(res.teacher_table)},
+            )
+            return res
+
+        @staticmethod
+        def _intern(value, ids, table):
+            i = ids.get(value, None)
+            if i is None:
+                i = ids[value] = len(table)
+                table.append(value)
+            return i
+
+        def append(self, name, teacher, start):
+            self.names.append(self._intern(name, self._ids[0], self.name_table))
+            self.teachers.append(self._intern(teacher, self._ids[1], self.teacher_table))
+            self.starts.append(start)
+            self._busy = None
+
+        def sort(self):
+            order = sorted(range(len(self.starts)), key=self.starts.__getitem__)
+            self.starts = array.array('q', (self.starts[i] for i in order))
+            self.names = array.array('l', (self.names[i] for i in order))
+            self.teachers = array.array('l', (self.teachers[i] for i in order))
+
+        def busy(self):
+            if self._busy is None:
+                self._busy = busy_index(self.starts)
+            return self._busy
+
+        def __len__(self):
+            return len(self.starts)
+
+        def __getitem__(self, i):
+            if isinstance(i, slice):
+                return [self[j] for j in range(*i.indices(len(self)))]
+            return jwxt.course_time(
+                self.name_table[self.names[i]],
+                self.teacher_table[self.teachers[i]],
+                _EPOCH + datetime.timedelta(seconds=self.starts[i]),
+            )
+
+        def __repr__(self):
+            return repr(list(self))
+
+    @limiter.prioritized(limiter.PRIORITY_POLL)
     def timetable(self, year, season):
         _season = min(season, 2)
         head = '%04d-%04d' % (year - _season + 1, year - _season + 2)
-        schedules = []
         url = f'{self.weburl}/{self.path_id}/kbcx/queryGrkb?xnxq={head}{season}'
-        while True:
-            res = self.get(url).text
-            tables = re.findall(timetable_re, res)
-            tables = list(zip(*tables))
-            first_day = self.first_day(year, season)
-            if len(tables) == 7 and first_day:
-                break
-            self.refresh()
+        first_day = None
+
+        def fetch():
+            nonlocal first_day
+            tables = list(zip(*(row[2:] for row in _timetable_rows(self.get(url).text))))
+            if first_day is None:
+                first_day = self.first_day(year, season)
+            if len(tables) != 7 or not first_day:
+                raise BUAAException('Failed to get the timetable')
+            return tables
+
+        tables = self.retry.call('jwxt/queryGrkb', fetch, recover=self.refresh)
+        schedules = self.course_table(first_day)
+        first = _seconds(first_day)
         for i in range(7):
             table = tables[i]
             for item_raw in table:
                 if item_raw == '&nbsp': continue
-                item = re.search(timetable_all_re, item_raw)
+                item = _timetable_cell(item_raw)
                 if item is None: continue
-                course_name, schedule = item.groups()
-                m = re.search(timetable_item_grouped_re, schedule)
-                while m is not None:
-                    schedule = schedule[m.end() + 1:]
-                    teacher_weeks, classroom, tspan = m.groups()
-                    teacher_weeks = _teacher_weeks(teacher_weeks)
-                    tspan = timespan(tspan)
-                    tspan = list(map(time_lut, tspan))
+                course_name, items = item
+                for teacher_weeks, tspan in items:
+                    tspan = [PERIOD_SECONDS[min(max(t, 1), 14) - 1] for t in timespan(tspan)]
                     for teacher, weeks in teacher_weeks:
                         for w in timespan(weeks):
+                            day = first + ((w - 1) * 7 + i) * 86400
                             for t in tspan:
-                                date = first_day + datetime.timedelta(days=(w - 1) * 7 + i) + t
-                                schedules.append(self.course_time(
-                                    course_name,
-                                    teacher,
-                                    date,
-                                ))
-                    m = re.search(timetable_item_grouped_re, schedule)
-        return sorted(schedules)
+                                schedules.append(course_name, teacher, day + t)
+        schedules.sort()
+        return schedules
+
+    @classmethod
+    def cached_timetable(cls, cache: session_cache, year, season, connect, on_update=None):
+        # Stale-while-revalidate: a cached timetable is returned at once while a
+        # background thread logs in through `connect()` and refetches it.
+        name = f'timetable:{year}:{season}'
+
+        def fetch():
+            table = connect().timetable(year, season)
+            if cache is not None:
+                cache.store(name, table.state())
+            return table
+
+        state = cache.load(name) if cache is not None else None
+        if state is None:
+            return fetch()
+        table = cls.course_table.from_state(state)
+
+        def revalidate():
+            try:
+                table = fetch()
+            except Exception:
+                return
+            if on_update is not None:
+                on_update(table)
+
+        threading.Thread(target=revalidate, daemon=True).start()
+        return table
 
     @classmethod
     def semester_infer(cls, month=time.localtime().tm_mon):
         return 2 if month < 6 else (3 if month < 8 else 1)
 
+    @classmethod
+    def busy(cls, schedule_list):
+        if isinstance(schedule_list, cls.course_table):
+            return schedule_list.busy()
+        return busy_index.from_schedule(schedule_list)
+
     @classmethod
     def _schedule_available(cls, t, tspan, schedule_list, span=datetime.timedelta()):
         pos = _binary_search(t, schedule_list)
@@ -848,15 +1428,62 @@ class jwxt(login):
         return True
 
 
-def _teacher_weeks(teacher_weeks):
-    res = []
-    m = re.search(week_single_grouped_re, teacher_weeks)
-    while m:
-        teacher_weeks = teacher_weeks[m.end() + 1:]
-        teacher, week = m.groups()
-        res.append((re.sub(r'\s', '', teacher), week))
-        m = re.search(week_single_grouped_re, teacher_weeks)
-    return res
+_timetable_tag_re = re.compile(r'<(/?)(tr|td)\b[^>]*>')
+_timetable_week_re = re.compile(rf'([^\[\]]*)\[{timespan_grouped_re}\]周?')
+_timetable_period_re = re.compile(rf'\s*第{timespan_grouped_re}节')
+_whitespace_re = re.compile(r'\s*')
+_whitespace_all_re = re.compile(r'\s')
+
+def _timetable_rows(page, width=9):
+    # One pass over the <tr>/<td> tags of the page, yielding the raw cell contents
+    # of every row with exactly `width` cells.
+    row = None
+    start = None
+    for m in _timetable_tag_re.finditer(page):
+        closing, tag = m.groups()
+        if tag == 'tr':
+            if closing and row is not None and len(row) == width:
+                yield row
+            row = None if closing else []
+            start = None
+        elif row is not None:
+            if not closing:
+                start = m.end()
+            elif start is not None:
+                row.append(page[start:m.start()])
+                start = None
+
+def _timetable_cell(cell):
+    # Parses `name</br>teacher[weeks]周,...(</br>)classroom 第periods节,...` by moving
+    # a position through the cell, so no substring is copied or searched twice.
+    br = cell.find('</br>')
+    while br >= 0:
+        name = cell[cell.rfind('<', 0, br) + 1:br]
+        pos = _whitespace_re.match(cell, br + 5).end()
+        items = []
+        while True:
+            teacher_weeks = []
+            m = _timetable_week_re.match(cell, pos)
+            while m is not None:
+                teacher_weeks.append((_whitespace_all_re.sub('', m.group(1)), m.group(2)))
+                pos = m.end()
+                m = _timetable_week_re.match(cell, pos + 1) if cell.startswith((',', '，'), pos) else None
+            if not teacher_weeks:
+                break
+            if cell.startswith('</br>', pos):
+                pos += 5
+            m = _timetable_period_re.search(cell, pos)
+            if m is None:
+                break
+            items.append((teacher_weeks, m.group(1)))
+            pos = m.end()
+            if not cell.startswith((',', '，'), pos):
+                break
+            pos += 1
+        if items:
+            return name, items
+        br = cell.find('</br>', br + 5)
+    return None
 
 def timespan(s: str):
     times = re.split('[,，]', s)
@@ -874,46 +1501,100 @@ def timespan(s: str):
 
 COURSE_SPAN = datetime.timedelta(minutes=45)
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+_SECOND = datetime.timedelta(seconds=1)
+
+def _seconds(d):
+    if isinstance(d, datetime.timedelta):
+        return d // _SECOND
+    return (d - _EPOCH) // _SECOND
+
+# Merged busy intervals of a timetable as two sorted integer arrays (seconds since
+# the naive epoch). Since intervals are disjoint, both arrays are ascending.
+class busy_index:
+    def __init__(self, starts, span=COURSE_SPAN):
+        span = _seconds(span)
+        merged_starts, merged_ends = [], []
+        for s in sorted(starts):
+            if merged_ends and s <= merged_ends[-1]:
+                merged_ends[-1] = max(merged_ends[-1], s + span)
+            else:
+                merged_starts.append(s)
+                merged_ends.append(s + span)
+        numpy = _load_numpy()
+        if numpy is not None:
+            self.starts = numpy.array(merged_starts, dtype=numpy.int64)
+            self.ends = numpy.array(merged_ends, dtype=numpy.int64)
+        else:
+            self.starts = merged_starts
+            self.ends = merged_ends
+
+    @classmethod
+    def from_schedule(cls, schedule_list):
+        return cls(_seconds(c.date) for c in schedule_list)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def available(self, t, tspan, span=datetime.timedelta()):
+        # Same rule as jwxt._schedule_available: no busy interval may come closer than
+        # `span` to [t, t + tspan).
+        t, tspan, span = _seconds(t), _seconds(tspan), _seconds(span)
+        i = bisect.bisect_right(self.ends, t - span)
+        return i >= len(self.starts) or self.starts[i] >= t + tspan + span
+
+    def available_batch(self, items):
+        items = list(items)
+        if not len(self.starts):
+            return [True] * len(items)
+        numpy = _load_numpy()
+        if numpy is None:
+            return [self.available(*item) for item in items]
+        t, tspan, span = (numpy.array([_seconds(v) for v in column], dtype=numpy.int64) for column in zip(*items))
+        i = numpy.searchsorted(self.ends, t - span, side='right')
+        n = len(self.starts)
+        mask = i >= n
+        mask |= self.starts[numpy.minimum(i, n - 1)] >= t + tspan + span
+        return mask.tolist()
+
+PERIODS = (
+    datetime.timedelta(hours=8, minutes=0),
+    datetime.timedelta(hours=8, minutes=50),
+    datetime.timedelta(hours=9, minutes=50),
+    datetime.timedelta(hours=10, minutes=40),
+    datetime.timedelta(hours=11, minutes=30),
+    datetime.timedelta(hours=14, minutes=0),
+    datetime.timedelta(hours=14, minutes=50),
+    datetime.timedelta(hours=15, minutes=50),
+    datetime.timedelta(hours=16, minutes=40),
+    datetime.timedelta(hours=17, minutes=30),
+    datetime.timedelta(hours=19, minutes=0),
+    datetime.timedelta(hours=19, minutes=50),
+    datetime.timedelta(hours=20, minutes=50),
+    datetime.timedelta(hours=21, minutes=40),
+)
+
+PERIOD_SECONDS = tuple(p // datetime.timedelta(seconds=1) for p in PERIODS)
+
 def time_lut(course_time):
-    course_time = min(max(int(course_time), 1), 14)
-    if course_time == 1:
-        return datetime.timedelta(hours=8, minutes=0)
-    if course_time == 2:
-        return datetime.timedelta(hours=8, minutes=50)
-    if course_time == 3:
-        return datetime.timedelta(hours=9, minutes=50)
-    if course_time == 4:
-        return datetime.timedelta(hours=10, minutes=40)
-    if course_time == 5:
-        return datetime.timedelta(hours=11, minutes=30)
-    if course_time == 6:
-        return datetime.timedelta(hours=14, minutes=0)
-    if course_time == 7:
-        return datetime.timedelta(hours=14, minutes=50)
-    if course_time == 8:
-        return datetime.timedelta(hours=15, minutes=50)
-    if course_time == 9:
-        return datetime.timedelta(hours=16, minutes=40)
-    if course_time == 10:
-        return datetime.timedelta(hours=17, minutes=30)
-    if course_time == 11:
-        return datetime.timedelta(hours=19, minutes=0)
-    if course_time == 12:
-        return datetime.timedelta(hours=19, minutes=50)
-    if course_time == 13:
-        return datetime.timedelta(hours=20, minutes=50)
-    if course_time == 14:
-        return datetime.timedelta(hours=21, minutes=40)
-    return NotImplemented
-
-def mail(args, sender, password, receiver=None, server=None, title='Reminder', file='src/reminder.html'):
+    return PERIODS[min(max(int(course_time), 1), 14) - 1]
+
+def mail(args, sender, password, receiver=None, server=None, title='Reminder', file='src/reminder.html',
+         dispatcher: 'smtp.dispatcher'=None):
+    # With a dispatcher the mail is only queued, and sent in background.
+    mime = smtp.mime_from_file(title, file, replace={'product_name': PRODUCT_NAME, **args})
+    if dispatcher is not None:
+        return dispatcher.send(mime, receiver=receiver)
     with smtp.login_mail(sender, password, server=server) as s:
-        return smtp.mail(s, smtp.mime_from_file(title, file, replace={'product_name': PRODUCT_NAME, **args}), receiver=receiver)
+        return smtp.mail(s, mime, receiver=receiver)
 
-def remind(course_detail, sender, password, receiver=None, server=None, title='Reminder'):
-    return mail({'course_detail': course_detail}, sender, password, receiver=receiver, server=server, title=title, file='src/reminder.html')
+def remind(course_detail, sender, password, receiver=None, server=None, title='Reminder',
+           dispatcher: 'smtp.dispatcher'=None):
+    return mail({'course_detail': course_detail}, sender, password, receiver=receiver, server=server, title=title,
+                file='src/reminder.html', dispatcher=dispatcher)
 
-def bykc_notice(course: bykc.course, sender, password, receiver=None, server=None, title='BYKC Notice: Enrolled in %s'):
+def bykc_notice(course: bykc.course, sender, password, receiver=None, server=None, title='BYKC Notice: Enrolled in %s',
+                dispatcher: 'smtp.dispatcher'=None):
     return mail({
         'course_id': course.id,
         'course_name': course.name,
@@ -928,16 +1609,25 @@ def bykc_notice(course: bykc.course, sender, password, receiver=None, server=Non
         'enroll_end': date2str(course.select_end),
         'description': course.desc if course.desc is not None else '',
         'max': course.max,
-    }, sender, password, receiver=receiver, server=server, title=title % ('%s %s' % (course.id, course.name)), file='src/bykc_notice.html')
+    }, sender, password, receiver=receiver, server=server, title=title % ('%s %s' % (course.id, course.name)),
+        file='src/bykc_notice.html', dispatcher=dispatcher)
 
 
 __all__ = [
     'BUAAException',
     'CASTGC',
+    'session_cache',
+    'poll_scheduler',
+    'server_clock',
+    'retry_policy',
+    'CircuitOpen',
+    'rate_limiter',
     'login',
     'bykc',
     'jwxt',
+    'busy_index',
     'mail',
     'remind',
     'bykc_notice',
+    'set_base_url',
 ]
@@ -3,6 +3,7 @@ This file is from https://github.com/Dr-Bluemond/BuaaBykcCrawler.
 """
 
 from urllib import parse as _parse
+import os as _os
 import re as _re
 import base64
 from cryptography.hazmat.backends import default_backend
@@ -10,6 +11,7 @@ from cryptography.hazmat.primitives import serialization, padding, hashes
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.asymmetric import padding as asymmetric_padding
 import random
+import functools
 
 b64encode = base64.b64encode
 b64decode = base64.b64decode
@@ -48,39 +50,85 @@ def unescape(s : str):
 
 RSA_PUBLIC_KEY = b"MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQDlHMQ3B5GsWnCe7Nlo1YiG/YmHdlOiKOST5aRm4iaqYSvhvWmwcigoyWTM+8bv2+sf6nQBRDWTY4KmNV7DBk1eDnTIQo6ENA31k5/tYCLEXgjPbEjCK9spiyB62fCT6cqOhbamJB0lcDJRO6Vo1m3dy+fD0jbxfDVBBNtyltIsDQIDAQAB"
 
-public_key = serialization.load_der_public_key(base64.b64decode(RSA_PUBLIC_KEY), backend=default_backend())
+# A stand-in server has its own key pair, see buaa.mock.
+RSA_PUBLIC_KEY = _os.environ.get('BUAA_BYKC_PUBLIC_KEY', '').encode('ascii') or RSA_PUBLIC_KEY
+
+def set_public_key(key):
+    # Base64 DER of the RSA public key of the server.
+    global RSA_PUBLIC_KEY
+    RSA_PUBLIC_KEY = key.encode('ascii') if isinstance(key, str) else key
+    load_public_key.cache_clear()
+    rsa_encrypt.cache_clear()
+
+@functools.lru_cache(maxsize=None)
+def load_public_key():
+    return serialization.load_der_public_key(base64.b64decode(RSA_PUBLIC_KEY), backend=default_backend())
+
+def __getattr__(name):
+    # The key is parsed on first use rather than at import.
+    if name == 'public_key':
+        return load_public_key()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+AES_KEY_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+_random = random.SystemRandom()
+_pkcs7 = padding.PKCS7(128)
 
 def generate_aes_key() -> bytes:
-    return "".join(
-        [random.choice('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789') for _ in range(16)]
-    ).encode()
+    return "".join(_random.choices(AES_KEY_CHARS, k=16)).encode()
+
+@functools.lru_cache(maxsize=16)
+def _cipher(key: bytes) -> Cipher:
+    return Cipher(algorithms.AES(key), modes.ECB(), backend=default_backend())
 
 def aes_encrypt(message: bytes, key: bytes) -> bytes:
-    padder = padding.PKCS7(128).padder()
+    padder = _pkcs7.padder()
     padded_message = padder.update(message) + padder.finalize()
 
-    cipher = Cipher(algorithms.AES(key), modes.ECB(), backend=default_backend())
-    encryptor = cipher.encryptor()
+    encryptor = _cipher(key).encryptor()
 
     encrypted_message = encryptor.update(padded_message) + encryptor.finalize()
     return encrypted_message
 
 def aes_decrypt(message: bytes, key: bytes) -> bytes:
-    cipher = Cipher(algorithms.AES(key), modes.ECB(), backend=default_backend())
-    decryptor = cipher.decryptor()
+    decryptor = _cipher(key).decryptor()
 
     decrypted_message = decryptor.update(message) + decryptor.finalize()
 
-    unpadder = padding.PKCS7(128).unpadder()
+    unpadder = _pkcs7.unpadder()
     unpadded_message = unpadder.update(decrypted_message) + unpadder.finalize()
     return unpadded_message
 
+@functools.lru_cache(maxsize=256)
 def sign(message: bytes) -> bytes:
     digist = hashes.Hash(hashes.SHA1(), backend=default_backend())
     digist.update(message)
     return base64.b16encode(digist.finalize()).lower()
 
+# PKCS1v15 is randomized, but the server accepts any valid ciphertext, so the
+# wrapped value of a repeated message can be reused.
+@functools.lru_cache(maxsize=256)
 def rsa_encrypt(message: bytes) -> bytes:
-    encrypted = public_key.encrypt(message, asymmetric_padding.PKCS1v15())
+    encrypted = load_public_key().encrypt(message, asymmetric_padding.PKCS1v15())
     return base64.b64encode(encrypted)
 
+# Per-session key material. The server decrypts the request and encrypts the
+# response with whatever AES key `ak` carries, so one RSA-wrapped key serves
+# every request of a session.
+class envelope:
+    def __init__(self, key: bytes=None):
+        if key is None:
+            key = generate_aes_key()
+        self.key = key
+        self.ak = rsa_encrypt(key).decode('utf8')
+
+    def signature(self, message: bytes) -> str:
+        return rsa_encrypt(sign(message)).decode('utf8')
+
+    def encrypt(self, message: bytes) -> bytes:
+        return aes_encrypt(message, self.key)
+
+    def decrypt(self, message: bytes) -> bytes:
+        return aes_decrypt(message, self.key)
+
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.buaa_course_grab')
+
+# Seconds after which a stored entry is considered stale without asking the server.
+DEFAULT_TTL = {
+    'castgc': 4 * 3600,
+    'bykc': 1800,
+    'jwxt': 1800,
+}
+
+SALT_SIZE = 16
+KDF_ITERATIONS = 200000
+
+
+class session_cache:
+    def __init__(self, username, password, type=None, path=None, ttl=None):
+        if path is None:
+            path = DEFAULT_PATH
+        self.path = path
+        self.username = username
+        self.type = type
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self._password = password.encode('utf8')
+        self._lock = threading.RLock()
+        self._fernet = None
+        self._salt = None
+        self._entries = None
+
+    @property
+    def filename(self):
+        key = hashlib.sha256(f'{self.username}:{self.type}'.encode('utf8')).hexdigest()[:32]
+        return os.path.join(self.path, f'{key}.session')
+
+    def _cipher(self, salt):
+        if self._fernet is None or self._salt != salt:
+            # cryptography is only loaded once a cache is actually used.
+            from cryptography.fernet import Fernet
+            from cryptography.hazmat.backends import default_backend
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+            kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KDF_ITERATIONS,
+                             backend=default_backend())
+            self._fernet = Fernet(base64.urlsafe_b64encode(kdf.derive(self._password)))
+            self._salt = salt
+        return self._fernet
+
+    def _read(self):
+        if self._entries is not None:
+            return self._entries
+        self._entries = {}
+        try:
+            with open(self.filename, 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return self._entries
+        salt, payload = raw[:SALT_SIZE], raw[SALT_SIZE:]
+        from cryptography.fernet import InvalidToken
+        try:
+            entries = json.loads(self._cipher(salt).decrypt(payload))
+        except (InvalidToken, ValueError):
+            # Corrupted file or changed password: behave as an empty cache.
+            return self._entries
+        if isinstance(entries, dict):
+            self._entries = entries
+        return self._entries
+
+    def _write(self):
+        salt = self._salt if self._salt is not None else os.urandom(SALT_SIZE)
+        payload = self._cipher(salt).encrypt(json.dumps(self._entries).encode('utf8'))
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        filename = self.filename
+        tmp = f'{filename}.{os.getpid()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(salt + payload)
+        os.replace(tmp, filename)
+
+    def load(self, name, ttl=None):
+        if ttl is None:
+            ttl = self.ttl.get(name, None)
+        with self._lock:
+            entry = self._read().get(name, None)
+        if entry is None:
+            return None
+        if ttl is not None and time.time() - entry.get('time', 0) > ttl:
+            return None
+        return entry.get('state', None)
+
+    def age(self, name):
+        with self._lock:
+            entry = self._read().get(name, None)
+        if entry is None:
+            return None
+        return time.time() - entry.get('time', 0)
+
+    def store(self, name, state):
+        with self._lock:
+            self._read()[name] = {'time': time.time(), 'state': state}
+            self._write()
+
+    def discard(self, name=None):
+        with self._lock:
+            entries = self._read()
+            if name is None:
+                entries.clear()
+            else:
+                entries.pop(name, None)
+            self._write()
+
+
+__all__ = [
+    'DEFAULT_PATH',
+    'DEFAULT_TTL',
+    'session_cache',
+]
@@ -0,0 +1,54 @@
+import datetime
+import email.utils
+import time
+
+DEFAULT_ALPHA = 0.1  # weight of a new sample once the estimate has settled
+
+
+# Estimates the offset of the server clock from the local one out of the `Date`
+# header of responses. The header only has a resolution of one second and is
+# stamped somewhere between sending the request and receiving the response, so
+# every sample is taken at the middle of both and smoothed with the previous
+# ones: a plain average over the first samples, an EWMA afterwards.
+class server_clock:
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.offset = 0.0
+        self.rtt = None
+        self.samples = 0
+
+    def observe(self, res, sent, received):
+        # `sent` and `received` are local epoch seconds around the request.
+        rtt = received - sent
+        alpha = max(self.alpha, 1 / (self.samples + 1))
+        self.rtt = rtt if self.rtt is None else self.rtt + alpha * (rtt - self.rtt)
+        date = res.headers.get('Date', None)
+        if date is None:
+            return
+        date = email.utils.parsedate_tz(date)
+        if date is None:
+            return
+        sample = email.utils.mktime_tz(date) + 0.5 - (sent + received) / 2
+        self.offset += alpha * (sample - self.offset)
+        self.samples += 1
+
+    def time(self):
+        return time.time() + self.offset
+
+    def now(self):
+        # Naive local datetime as shown by the server, comparable with the
+        # enrollment windows parsed from the APIs.
+        return datetime.datetime.fromtimestamp(self.time())
+
+    def stats(self):
+        return {'offset': self.offset, 'rtt': self.rtt, 'samples': self.samples}
+
+    def __str__(self):
+        if not self.samples:
+            return 'unknown'
+        return f'{self.offset:+.3f}s (RTT {self.rtt * 1000:.0f} ms, {self.samples} samples)'
+
+
+__all__ = [
+    'server_clock',
+]
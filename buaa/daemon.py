@@ -0,0 +1,347 @@
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import threading
+import socketserver
+
+from . import CASTGC, BUAAException, CircuitOpen, bykc, jwxt, retry_policy, session_cache
+from .cache import DEFAULT_PATH
+
+KEEPALIVE = 300  # seconds between checks of idle sessions
+TIMETABLE_TTL = 1800  # seconds a timetable is served from memory
+
+
+def socket_path(username, type=None, path=None):
+    # One socket per account and VPN index, next to the session cache files.
+    if path is None:
+        path = DEFAULT_PATH
+    key = hashlib.sha256(f'{username}:{type}'.encode('utf8')).hexdigest()[:32]
+    return os.path.join(path, f'{key}.sock')
+
+
+# Holds authenticated bykc and jwxt clients of one account, and serves their
+# operations as JSON lines over a Unix domain socket. Each request is an object
+# `{"op": name, "args": {...}}`, each response `{"ok": true, "result": ...}` or
+# `{"ok": false, "error": message, "type": exception class, ...}`.
+class session_daemon:
+    def __init__(self, username, password, type=None, path=None, cache: session_cache=None, retry_limit=16):
+        self.path = socket_path(username, type, path)
+        self.cache = cache
+        self.token = CASTGC(username, password, type=type, cache=cache)
+        self.retry = retry_policy(attempts=retry_limit + 1)
+        self.retry_limit = retry_limit
+        self.clients = {}
+        self.locks = {'bykc': threading.RLock(), 'jwxt': threading.RLock()}
+        self.timetables = {}
+        self.server = None
+        self.ops = {
+            'ping': lambda: True,
+            'shutdown': self.shutdown,
+            'diagnostics': self.diagnostics,
+            'bykc.list': self.bykc_list,
+            'bykc.chosen': self.bykc_chosen,
+            'bykc.detail': self.bykc_detail,
+            'bykc.batch': self.bykc_batch,
+            'bykc.outcomes': self.bykc_outcomes,
+            'jwxt.watch': self.jwxt_watch,
+            'jwxt.choose': self.jwxt_choose,
+            'jwxt.drop': self.jwxt_drop,
+            'jwxt.timetable': self.jwxt_timetable,
+        }
+
+    def client(self, name):
+        # Clients log in on first use; afterwards a stale or idle session is
+        # checked before it serves a request.
+        client = self.clients.get(name, None)
+        if client is None:
+            if name == 'bykc':
+                client = bykc(token=self.token, retry_limit=self.retry_limit, cache=self.cache, retry=self.retry)
+            else:
+                client = jwxt(token=self.token, cache=self.cache, retry=self.retry)
+            self.clients[name] = client
+        else:
+            client.warm()
+        return client
+
+    def records(self, client, courses):
+        return [client.records[id][1] for id in courses if id in client.records]
+
+    def bykc_list(self, name='selectable'):
+        with self.locks['bykc']:
+            b = self.client('bykc')
+            courses = b.forecast if name == 'forecast' else b.selectable
+            return self.records(b, courses)
+
+    def bykc_chosen(self):
+        with self.locks['bykc']:
+            b = self.client('bykc')
+            return self.records(b, b.chosen)
+
+    def bykc_detail(self, id):
+        with self.locks['bykc']:
+            b = self.client('bykc')
+            b.detail(id)
+            return b.records[id][1]
+
+    def bykc_batch(self, enroll=(), drop=()):
+        with self.locks['bykc']:
+            return list(self.client('bykc').batch(enroll=enroll, drop=drop).items())
+
+    def bykc_outcomes(self, enroll=(), drop=()):
+        with self.locks['bykc']:
+            return list(self.client('bykc').outcomes(enroll=enroll, drop=drop).items())
+
+    def jwxt_watch(self, year, season, targets, course_type=None, external=False):
+        with self.locks['jwxt']:
+            res = self.client('jwxt').watch(year, season, [tuple(t) for t in targets], course_type,
+                                            external=external)
+            return [[course_id, tail, rest] for (course_id, tail), rest in res.items()]
+
+    def jwxt_choose(self, year, season, course_id, course_type='ZY', tail='001', external=False, wish=None,
+                    weight=None):
+        with self.locks['jwxt']:
+            return self.client('jwxt').choose(year, season, course_id, course_type, tail, external=external,
+                                              wish=wish, weight=weight)
+
+    def jwxt_drop(self, year, season, course_id, tail='001'):
+        with self.locks['jwxt']:
+            return self.client('jwxt').drop(year, season, course_id, tail)
+
+    def jwxt_timetable(self, year, season):
+        with self.locks['jwxt']:
+            entry = self.timetables.get((year, season), None)
+            if entry is not None and entry[0] + TIMETABLE_TTL > time.monotonic():
+                return entry[1]
+            state = self.client('jwxt').timetable(year, season).state()
+            self.timetables[(year, season)] = (time.monotonic(), state)
+            return state
+
+    def diagnostics(self):
+        return {name: client.diagnostics() for name, client in self.clients.items()}
+
+    def handle(self, request):
+        try:
+            op = self.ops.get(request.get('op', None), None)
+            if op is None:
+                raise BUAAException(f'Unknown operation {request.get("op", None)}')
+            return {'ok': True, 'result': op(**request.get('args', {}))}
+        except CircuitOpen as e:
+            return {'ok': False, 'error': str(e), 'type': 'CircuitOpen', 'service': e.service,
+                    'retry_after': e.retry_after}
+        except Exception as e:
+            return {'ok': False, 'error': str(e), 'type': e.__class__.__qualname__,
+                    'status': getattr(e, 'status', None)}
+
+    def keepalive(self):
+        # Keeps idle sessions alive, so that a command after a long pause does not
+        # start with a login.
+        while not self.stopped.wait(KEEPALIVE):
+            for name, client in list(self.clients.items()):
+                with self.locks[name]:
+                    try:
+                        client.warm()
+                    except Exception:
+                        pass
+
+    def serve(self):
+        daemon = self
+
+        class handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        response = {'ok': False, 'error': 'Malformed request', 'type': 'ValueError'}
+                    else:
+                        response = daemon.handle(request)
+                    self.wfile.write(json.dumps(response).encode('utf8') + b'\n')
+                    self.wfile.flush()
+
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        if os.path.exists(self.path):
+            if connect(path=self.path) is not None:
+                raise BUAAException(f'A daemon is already listening on {self.path}')
+            os.unlink(self.path)
+        old_umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.path, handler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon_threads = True
+        self.stopped = threading.Event()
+        threading.Thread(target=self.keepalive, daemon=True).start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.stopped.set()
+            self.server.server_close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        # serve_forever() has to be stopped from another thread than its own.
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return True
+
+
+class daemon_client:
+    def __init__(self, path, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.file = self.sock.makefile('rwb')
+        self.lock = threading.Lock()
+
+    def call(self, op, **args):
+        with self.lock:
+            self.file.write(json.dumps({'op': op, 'args': args}).encode('utf8') + b'\n')
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise BUAAException('The daemon closed the connection')
+        response = json.loads(line)
+        if response.get('ok', False):
+            return response.get('result', None)
+        if response.get('type', None) == 'CircuitOpen':
+            raise CircuitOpen(response['service'], response['retry_after'])
+        raise BUAAException(response.get('error', 'Unknown error'), status=response.get('status', None))
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def bykc(self):
+        return remote_bykc(self)
+
+    def jwxt(self):
+        return remote_jwxt(self)
+
+
+def connect(username=None, type=None, path=None):
+    # Returns a client of the daemon serving the account, or None when there is
+    # none running. `path` is the socket itself if no username is given.
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    if username is not None:
+        path = socket_path(username, type, path)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        client = daemon_client(path, timeout=5)
+        client.call('ping')
+    except (OSError, ValueError, BUAAException):
+        return None
+    client.sock.settimeout(None)
+    return client
+
+
+# Stand-ins for bykc and jwxt clients that run their operations in the daemon.
+class remote_bykc:
+    def __init__(self, client: daemon_client):
+        self.client = client
+        self.built = {}
+
+    def courses(self, data):
+        return bykc.course_map(data, bykc.course, self.built)
+
+    @property
+    def selectable(self):
+        return self.courses(self.client.call('bykc.list'))
+
+    @property
+    def forecast(self):
+        return self.courses(self.client.call('bykc.list', name='forecast'))
+
+    @property
+    def chosen(self):
+        return self.courses(self.client.call('bykc.chosen'))
+
+    def detail(self, id, throw=False):
+        return bykc.course(self.client.call('bykc.detail', id=id))
+
+    def outcomes(self, enroll=(), drop=(), throw=False):
+        return dict(self.client.call('bykc.outcomes', enroll=list(enroll), drop=list(drop)))
+
+    def batch(self, enroll=(), drop=(), throw=False):
+        return dict(self.client.call('bykc.batch', enroll=list(enroll), drop=list(drop)))
+
+    def enroll(self, id, throw=False):
+        return self.batch(enroll=[id], throw=throw)[id]
+
+    def drop(self, id, throw=False):
+        return self.batch(drop=[id], throw=throw)[id]
+
+
+class remote_jwxt:
+    def __init__(self, client: daemon_client):
+        self.client = client
+
+    def watch(self, year, season, targets, course_type=None, *, external=False, verbose=False):
+        res = self.client.call('jwxt.watch', year=year, season=season, targets=[list(t) for t in targets],
+                               course_type=course_type, external=external)
+        return {(course_id, tail): rest for course_id, tail, rest in res}
+
+    def choose(self, year, season, course_id: str, course_type='ZY', tail='001', *, external=False, wish=None,
+               weight=None, verbose=False):
+        return self.client.call('jwxt.choose', year=year, season=season, course_id=course_id,
+                                course_type=course_type, tail=tail, external=external, wish=wish, weight=weight)
+
+    def drop(self, year, season, course_id: str, tail='001'):
+        return self.client.call('jwxt.drop', year=year, season=season, course_id=course_id, tail=tail)
+
+    def timetable(self, year, season):
+        return jwxt.course_table.from_state(self.client.call('jwxt.timetable', year=year, season=season))
+
+
+parser = argparse.ArgumentParser(prog='python -m buaa.daemon', add_help=False,
+                                 description='Keeps the BYKC and JWXT sessions of an account alive and serves '
+                                             'bykc.py and jwxt.py over a local socket.')
+parser.add_argument('-h', '--help', action='help', help='To show help.')
+parser.add_argument('username', type=str, help='The unified identity authentication account.')
+parser.add_argument('password', type=str, help='Password of the account.')
+parser.add_argument('-V', '--vpn', default=None, type=str, help='The index of VPN used.')
+parser.add_argument('--cache', nargs='?', default=..., type=str, metavar='path',
+                    help='Whether to keep the login session in an encrypted on-disk cache as well.')
+parser.add_argument('--socket', default=None, type=str, metavar='dir',
+                    help=f'The directory of the control socket. The default is {DEFAULT_PATH}.')
+
+
+def main():
+    args = parser.parse_args()
+    if not hasattr(socket, 'AF_UNIX'):
+        print('Unix domain sockets are not supported on this platform.')
+        return
+    cache = None
+    if args.cache is not ...:
+        cache = session_cache(args.username, args.password, type=args.vpn, path=args.cache)
+    daemon = session_daemon(args.username, args.password, type=args.vpn, path=args.socket, cache=cache)
+    print(f'Listening on {daemon.path}')
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+__all__ = [
+    'socket_path',
+    'session_daemon',
+    'daemon_client',
+    'connect',
+    'remote_bykc',
+    'remote_jwxt',
+]
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f'{e.__class__.__qualname__}: {str(e)}')
+        sys.exit(1)
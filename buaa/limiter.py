@@ -0,0 +1,132 @@
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import threading
+import time
+import urllib.parse
+
+DEFAULT_RATE = 5  # sustained requests per second to one host
+DEFAULT_BURST = 10  # requests to one host that may be sent at once
+
+PRIORITY_ACTION = 0  # enrolling and dropping
+PRIORITY_REQUEST = 1  # everything else, e.g. logins
+PRIORITY_POLL = 2  # list refreshes
+
+_priority = contextvars.ContextVar('priority', default=None)
+
+
+@contextlib.contextmanager
+def priority(level):
+    # Requests sent in this context queue for the limiter with the given priority.
+    # An enclosing context keeps its own, e.g. the check of chosen courses after
+    # an enrollment stays an action.
+    if _priority.get() is not None:
+        yield
+        return
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def prioritized(level):
+    # Decorates a function whose requests all share one priority.
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with priority(level):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# A token bucket per host. Requests that find the bucket empty wait in a queue
+# ordered by priority, then by arrival, so that an enrollment never waits
+# behind list refreshes.
+class rate_limiter:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.buckets = {}
+        self.queues = {}
+        self.order = itertools.count()
+        self.stats = {}
+
+    def configure(self, rate=None, burst=None):
+        with self.cond:
+            if rate is not None:
+                self.rate = rate
+            if burst is not None:
+                self.burst = max(burst, 1)
+            self.cond.notify_all()
+
+    def __refill(self, host, now):
+        tokens, last = self.buckets.get(host, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        self.buckets[host] = (tokens, now)
+        return tokens
+
+    def acquire(self, host, level=None):
+        # Blocks until a request to `host` may be sent, and returns the seconds
+        # waited. A rate of None or 0 disables the limit.
+        if level is None:
+            level = _priority.get()
+        if level is None:
+            level = PRIORITY_REQUEST
+        start = self.clock()
+        with self.cond:
+            queue = self.queues.setdefault(host, [])
+            entry = (level, next(self.order))
+            heapq.heappush(queue, entry)
+            self.cond.notify_all()
+            while True:
+                if not self.rate:
+                    tokens = self.burst
+                else:
+                    tokens = self.__refill(host, self.clock())
+                if queue[0] is entry and tokens >= 1:
+                    heapq.heappop(queue)
+                    if self.rate:
+                        self.buckets[host] = (tokens - 1, self.buckets[host][1])
+                    self.cond.notify_all()
+                    break
+                # Only the head of the queue waits for the bucket, the others for
+                # their turn.
+                self.cond.wait((1 - tokens) / self.rate if queue[0] is entry else None)
+            waited = self.clock() - start
+            count, total, longest = self.stats.get(level, (0, 0, 0))
+            self.stats[level] = (count + 1, total + waited, max(longest, waited))
+        return waited
+
+    def acquire_url(self, url, level=None):
+        return self.acquire(urllib.parse.urlsplit(url).hostname, level)
+
+    def report(self):
+        # Number of requests, total and longest wait by priority.
+        with self.cond:
+            return {level: {'count': count, 'wait': total, 'max': longest}
+                    for level, (count, total, longest) in sorted(self.stats.items())}
+
+
+# The process-wide limiter used by every session of this package.
+default = rate_limiter()
+
+
+def configure(rate=None, burst=None):
+    default.configure(rate, burst)
+
+
+__all__ = [
+    'PRIORITY_ACTION',
+    'PRIORITY_REQUEST',
+    'PRIORITY_POLL',
+    'priority',
+    'prioritized',
+    'rate_limiter',
+    'configure',
+]
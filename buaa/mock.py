@@ -0,0 +1,539 @@
+import sys
+import json
+import time
+import base64
+import random
+import secrets
+import argparse
+import datetime
+import threading
+import email.utils
+import urllib.parse
+import http.server
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, padding as asymmetric_padding
+
+from . import bykc_encrypt, set_base_url
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8800
+DEFAULT_COURSES = 20  # BYKC courses
+DEFAULT_SECTIONS = 3  # JWXT sections of each course
+DEFAULT_CHURN = 0.5  # seat changes per second caused by other students
+
+JWXT_COURSES = ('B3I062410', 'B3J063940', 'B3E331150', 'B2F020060', 'B3I094100')
+COURSE_NAMES = ('高等数学', 'Physics', '工科数学分析（2）', '博雅讲座', 'Writing')
+TEACHERS = ('张三', '李 四', 'Wang')
+CLASSROOMS = ('J3-101', '主M201', '(一)301', '沙河校区实验楼', '学术交流厅')
+
+
+def _date2str(d):
+    return d.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Everything the stand-in server knows: one account, its tickets and sessions,
+# the BYKC courses and JWXT sections with their seats. Other students are
+# simulated by a thread moving seats around.
+class campus:
+    def __init__(self, username, password, courses=DEFAULT_COURSES, sections=DEFAULT_SECTIONS, open_in=60,
+                 churn=DEFAULT_CHURN, seed=None):
+        self.username = username
+        self.password = password
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=1024,
+                                                    backend=default_backend())
+        self.executions = set()
+        self.tgcs = set()
+        self.tickets = {}
+        self.bykc_tokens = set()
+        self.jsessions = set()
+        self.jwxt_tokens = set()
+        self.churn = churn
+        self.stopped = threading.Event()
+
+        now = datetime.datetime.now().replace(microsecond=0)
+        self.bykc_courses = {}
+        for i in range(courses):
+            # A third of the courses is open, a third opens after `open_in` seconds
+            # and the rest has closed already.
+            phase = i % 3
+            select_start = now + datetime.timedelta(seconds=open_in) if phase == 1 else \
+                now - datetime.timedelta(hours=1 + 24 * (phase == 2))
+            select_end = now - datetime.timedelta(hours=1) if phase == 2 else now + datetime.timedelta(days=1)
+            start = now + datetime.timedelta(days=2 + i % 5, hours=i % 8)
+            maximum = self.random.randint(20, 200)
+            self.bykc_courses[1000 + i] = {
+                'id': 1000 + i,
+                'courseName': f'{COURSE_NAMES[i % len(COURSE_NAMES)]} {i}',
+                'courseTeacher': TEACHERS[i % len(TEACHERS)],
+                'courseContact': 'Organizer',
+                'courseCollege': '["全校"]',
+                'courseCampus': json.dumps(['学院路' if i % 2 else '沙河'], ensure_ascii=False),
+                'coursePosition': CLASSROOMS[i % len(CLASSROOMS)],
+                'courseMaxCount': maximum,
+                'courseCurrentCount': self.random.randint(maximum // 2, maximum),
+                'courseSelectStartDate': _date2str(select_start),
+                'courseSelectEndDate': _date2str(select_end),
+                'courseStartDate': _date2str(start),
+                'courseEndDate': _date2str(start + datetime.timedelta(hours=2)),
+                'courseDesc': 'A course of the stand-in server.',
+            }
+        self.bykc_chosen = set()
+
+        self.jwxt_sections = {}
+        for course_id in JWXT_COURSES:
+            for tail in range(1, sections + 1):
+                maximum = self.random.randint(30, 120)
+                self.jwxt_sections[(course_id, '%03d' % tail)] = [
+                    self.random.randint(maximum - 5, maximum), maximum, self.random.randint(0, 5), 5]
+        self.jwxt_enrolled = set()
+
+    @property
+    def public_key(self):
+        der = self.private_key.public_key().public_bytes(serialization.Encoding.DER,
+                                                         serialization.PublicFormat.SubjectPublicKeyInfo)
+        return base64.b64encode(der).decode('ascii')
+
+    def decrypt(self, message):
+        return self.private_key.decrypt(base64.b64decode(message), asymmetric_padding.PKCS1v15())
+
+    def issue(self, store, prefix):
+        value = f'{prefix}-{secrets.token_hex(12)}'
+        store.add(value)
+        return value
+
+    def simulate(self):
+        # Other students take and release seats.
+        while self.churn > 0 and not self.stopped.wait(1 / self.churn):
+            with self.lock:
+                if self.random.random() < 0.5:
+                    course = self.random.choice(list(self.bykc_courses.values()))
+                    delta = self.random.choice((-1, 1))
+                    course['courseCurrentCount'] = min(max(course['courseCurrentCount'] + delta, 0),
+                                                       course['courseMaxCount'])
+                else:
+                    places = self.random.choice(list(self.jwxt_sections.values()))
+                    places[0] = min(max(places[0] + self.random.choice((-1, 1)), 0), places[1])
+
+
+class handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'BUAAMock/1.0'
+    # Headers and body are written separately; with Nagle's algorithm the body
+    # would wait for the delayed ACK of a kept-alive connection.
+    disable_nagle_algorithm = True
+
+    @property
+    def campus(self) -> campus:
+        return self.server.campus
+
+    def setup(self):
+        # A new connection pays for the TCP and TLS handshakes of a real server.
+        super().setup()
+        if self.server.handshake:
+            time.sleep(self.server.handshake)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def date_time_string(self, timestamp=None):
+        # The clock of the server may be off by `skew` seconds.
+        if timestamp is None:
+            timestamp = time.time()
+        return email.utils.formatdate(timestamp + self.server.skew, usegmt=True)
+
+    # Responses
+
+    def respond(self, status=200, body=b'', content_type='text/html;charset=UTF-8', headers=()):
+        if isinstance(body, str):
+            body = body.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, headers=()):
+        self.respond(302, headers=(('Location', location), *headers))
+
+    # Requests
+
+    @property
+    def url(self):
+        return urllib.parse.urlsplit(self.path)
+
+    @property
+    def query(self):
+        return {k: v[0] for k, v in urllib.parse.parse_qs(self.url.query).items()}
+
+    @property
+    def cookies(self):
+        res = {}
+        for part in self.headers.get('Cookie', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name:
+                res[name] = value
+        return res
+
+    def body(self):
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        return self.rfile.read(length)
+
+    def form(self):
+        return {k: v[0] for k, v in urllib.parse.parse_qs(self.body().decode('utf8'), keep_blank_values=True).items()}
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        server = self.server
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.random() * server.jitter)
+        if server.failure and random.random() < server.failure:
+            self.body()
+            self.respond(503, 'Service Unavailable', content_type='text/plain')
+            return
+        service, _, rest = self.url.path.lstrip('/').partition('/')
+        route = getattr(self, f'{service}_{method.lower()}', None)
+        if route is None:
+            self.body()
+            self.respond(404, 'Not Found', content_type='text/plain')
+            return
+        route('/' + rest)
+
+    # CAS
+
+    def login_page(self):
+        execution = self.campus.issue(self.campus.executions, 'e1s1')
+        return self.respond(body='<html><form method="post">'
+                                 f'<input type="hidden" name="execution" value="{execution}"/>'
+                                 '</form></html>')
+
+    def sso_get(self, path):
+        if path == '/login':
+            return self.login_page()
+        self.respond(404)
+
+    def sso_post(self, path):
+        if path != '/login':
+            self.body()
+            return self.respond(404)
+        form = self.form()
+        campus = self.campus
+        target = self.query.get('TARGET', None)
+        with campus.lock:
+            if target is not None:
+                # Service login: exchange the ticket-granting cookie for a ticket.
+                if self.cookies.get('CASTGC', None) not in campus.tgcs:
+                    return self.login_page()
+                ticket = campus.issue(set(), 'ST')
+                campus.tickets[ticket] = target
+                return self.redirect(f"{target}{'&' if '?' in target else '?'}ticket={ticket}")
+            if form.get('username', None) != campus.username or form.get('password', None) != campus.password \
+                    or form.get('execution', None) not in campus.executions:
+                return self.respond(401, 'Invalid credentials')
+            campus.executions.discard(form['execution'])
+            tgc = campus.issue(campus.tgcs, 'TGT')
+        self.redirect('/sso/', headers=(('Set-Cookie', f'CASTGC={tgc}; Path=/sso; HttpOnly'),))
+
+    def redeem(self, service):
+        # Consumes the service ticket in the query, if it was issued for `service`.
+        ticket = self.query.get('ticket', None)
+        with self.campus.lock:
+            target = self.campus.tickets.pop(ticket, None)
+        return target is not None and f'/{service}/' in target
+
+    # WebVPN
+
+    def vpn_get(self, path):
+        if path == '/users/sign_in':
+            token = base64.b64encode(secrets.token_bytes(24)).decode('ascii')
+            return self.respond(body=f'<html><meta name="csrf-token" content="{token}" /></html>')
+        self.respond(body='<html>WebVPN</html>')
+
+    def vpn_post(self, path):
+        form = self.form()
+        if path != '/users/sign_in' or form.get('user[login]', None) != self.campus.username:
+            return self.respond(401, 'Invalid credentials')
+        self.redirect('/vpn/', headers=(('Set-Cookie', f'wengine_vpn_ticket={secrets.token_hex(8)}; Path=/'),))
+
+    # BYKC
+
+    def bykc_get(self, path):
+        if path == '/sscv/casLogin':
+            if not self.redeem('bykc'):
+                return self.redirect('/sso/login')
+            token = self.campus.issue(self.campus.bykc_tokens, 'bykc')
+            return self.redirect(f'/bykc/system/home?token={token}')
+        if path == '/system/home':
+            return self.respond(body='<html>BYKC</html>')
+        if path == '/public_key':
+            return self.respond(body=self.campus.public_key, content_type='text/plain')
+        self.respond(404)
+
+    def bykc_post(self, path):
+        raw = self.body()
+        if not path.startswith('/sscv/'):
+            return self.respond(404)
+        campus = self.campus
+        if self.headers.get('auth_token', None) not in campus.bykc_tokens:
+            return self.respond(body=json.dumps({'status': '98', 'errmsg': 'Not logged in', 'data': None}),
+                                content_type='application/json')
+        try:
+            key = campus.decrypt(self.headers['ak'])
+            message = bykc_encrypt.aes_decrypt(base64.b64decode(raw), key)
+            if campus.decrypt(self.headers['sk']) != bykc_encrypt.sign(message):
+                raise ValueError('Bad signature')
+            payload = json.loads(message) if message else {}
+        except (KeyError, ValueError):
+            return self.respond(400, 'Bad request', content_type='text/plain')
+        with campus.lock:
+            status, data = self.bykc_api(path[len('/sscv/'):], payload)
+            message = json.dumps({'status': status, 'errmsg': '' if status == '0' else data, 'data': data},
+                                  ensure_ascii=False)
+        self.respond(body=base64.b64encode(bykc_encrypt.aes_encrypt(message.encode('utf8'), key)),
+                     content_type='text/plain')
+
+    def bykc_api(self, name, payload):
+        campus = self.campus
+        now = datetime.datetime.now()
+        courses = campus.bykc_courses
+        if name == 'querySelectableCourse':
+            return '0', [c for c in courses.values() if now <= datetime.datetime.fromisoformat(c['courseSelectEndDate'])
+                         and datetime.datetime.fromisoformat(c['courseSelectStartDate']) <= now + datetime.timedelta(days=1)]
+        if name == 'queryForeCourse':
+            return '0', [c for c in courses.values()
+                         if datetime.datetime.fromisoformat(c['courseSelectStartDate']) > now]
+        if name == 'queryChosenCourse':
+            return '0', {'courseList': [{'courseInfo': courses[id]} for id in sorted(campus.bykc_chosen)],
+                         'historyCourseList': []}
+        if name == 'queryCourseById':
+            course = courses.get(payload.get('id', None), None)
+            return ('0', course) if course is not None else ('1', 'Course not found')
+        if name == 'choseCourse':
+            course = courses.get(payload.get('courseId', None), None)
+            if course is None:
+                return '1', 'Course not found'
+            if course['id'] in campus.bykc_chosen:
+                return '1', 'Already chosen'
+            if not datetime.datetime.fromisoformat(course['courseSelectStartDate']) <= now <= \
+                    datetime.datetime.fromisoformat(course['courseSelectEndDate']):
+                return '1', 'Not in the enrollment window'
+            if course['courseCurrentCount'] >= course['courseMaxCount']:
+                return '1', 'Course is full'
+            course['courseCurrentCount'] += 1
+            campus.bykc_chosen.add(course['id'])
+            return '0', {'courseCurrentCount': course['courseCurrentCount']}
+        if name == 'delChosenCourse':
+            id = payload.get('id', None)
+            if id not in campus.bykc_chosen:
+                return '1', 'Course not chosen'
+            campus.bykc_chosen.discard(id)
+            courses[id]['courseCurrentCount'] -= 1
+            return '0', {'courseCurrentCount': courses[id]['courseCurrentCount']}
+        return '1', f'Unknown API {name}'
+
+    # JWXT
+
+    def jwxt_session(self):
+        return self.cookies.get('JSESSIONID', None) in self.campus.jsessions
+
+    def jwxt_get(self, path):
+        if path == '/ieas2.1/welcome':
+            if self.redeem('jwxt'):
+                session = self.campus.issue(self.campus.jsessions, 'JS')
+                return self.redirect('/jwxt/ieas2.1/welcome?falg=1',
+                                     headers=(('Set-Cookie', f'JSESSIONID={session}; Path=/jwxt'),))
+            if not self.jwxt_session():
+                return self.redirect('/sso/login')
+            return self.respond(body='<html>JWXT</html>')
+        if not self.jwxt_session():
+            return self.redirect('/sso/login')
+        if path == '/ieas2.1/kbcx/queryGrkb':
+            return self.respond(body=self.timetable_page())
+        if path == '/ieas2.1/xlcx/queryXlcx':
+            return self.respond(body=self.calendar_page(self.query.get('xnxq', '')))
+        self.respond(404)
+
+    def jwxt_post(self, path):
+        form = self.form()
+        if not self.jwxt_session():
+            return self.redirect('/sso/login')
+        campus = self.campus
+        with campus.lock:
+            if path == '/ieas2.1/xslbxk/queryXsxkList':
+                return self.respond(body=self.selection_page(form.get('pageXnxq', ''), form.get('pageKcmc', '')))
+            if path == '/ieas2.1/xslbxk/saveXsxk':
+                key = self.section(form.get('rwh', ''))
+                places = campus.jwxt_sections.get(key, None)
+                if form.get('token', None) in campus.jwxt_tokens and places is not None \
+                        and key not in campus.jwxt_enrolled and places[0] < places[1]:
+                    campus.jwxt_tokens.discard(form['token'])
+                    places[0] += 1
+                    campus.jwxt_enrolled.add(key)
+                return self.respond(body=self.enrolled_page(form.get('rwh', '')[:11]))
+            if path == '/ieas2.1/xslbxk/saveXstk':
+                key = self.section(form.get('rwh', ''))
+                if key in campus.jwxt_enrolled:
+                    campus.jwxt_enrolled.discard(key)
+                    campus.jwxt_sections[key][0] -= 1
+                return self.respond(body=self.enrolled_page(form.get('rwh', '')[:11]))
+            if path == '/ieas2.1/xslbxk/queryYxkc':
+                return self.respond(body=self.enrolled_page(self.term(form.get('pageXnxq', ''))))
+        self.respond(404)
+
+    @staticmethod
+    def section(cid):
+        # `2025-2026-1-B3I062410-001` to `('B3I062410', '001')`
+        parts = cid.split('-')
+        return ('-'.join(parts[3:-1]), parts[-1]) if len(parts) >= 5 else None
+
+    @staticmethod
+    def term(xnxq):
+        # `2025-20261` to `2025-2026-1`
+        return f'{xnxq[:9]}-{xnxq[9:]}'
+
+    def selection_page(self, xnxq, course_id):
+        token = '%.6f' % (random.random() * 1000)
+        self.campus.jwxt_tokens.add(token)
+        rows = []
+        for (cid, tail), (cur, maximum, ext_cur, ext_max) in self.campus.jwxt_sections.items():
+            if cid == course_id.upper():
+                rows.append(f'<tr><td><input id="xkyq_{self.term(xnxq)}-{cid}-{tail}" type="hidden" value=""/>\n'
+                            f'{cur}/{maximum}</td><td>{ext_cur}/{ext_max}</td></tr>')
+        return ('<html><form method="post">'
+                f'<input type="hidden" id="token" name="token" value="{token}" />'
+                f'<table>{"".join(rows)}</table></form></html>')
+
+    def enrolled_page(self, term):
+        rows = ''.join(f'<tr id="{term}-{cid}-{tail}"><td>{cid}</td><td>{tail}</td></tr>'
+                       for cid, tail in sorted(self.campus.jwxt_enrolled))
+        return ('<html><form id="queryform" action="/jwxt/ieas2.1/xslbxk/queryYxkc" method="post">'
+                f'<table>{rows}</table></form></html>')
+
+    def calendar_page(self, xnxq):
+        month = 9 if xnxq.endswith('1') else 2
+        return (f'<html><div class="xfyq_top">{xnxq[:4]}年{month}月</div><table><tr>'
+                '<td align="center" class="sk_gray">1</td>'
+                '<td align="center" class="sk_green">\n  2</td></tr></table></html>')
+
+    def timetable_page(self):
+        rng = random.Random(self.server.seed)
+        rows = []
+        for r in range(6):
+            cells = []
+            for day in range(7):
+                if rng.random() < 0.6:
+                    cells.append('<td>&nbsp</td>')
+                    continue
+                p = 2 * r + 1
+                a = rng.randint(1, 8)
+                cells.append(f'<td class="c">{rng.choice(COURSE_NAMES)}</br>{rng.choice(TEACHERS)}[{a}-{a + 8}]周'
+                             f'</br>{rng.choice(CLASSROOMS)} 第{p}-{p + 1}节</td>')
+            rows.append(f'<tr class="row"><td>{r}</td><td>x</td>{"".join(cells)}</tr>')
+        return f'<html><table>{"".join(rows)}</table></html>'
+
+
+class mock_server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, campus: campus, host=DEFAULT_HOST, port=DEFAULT_PORT, latency=0, jitter=0, failure=0,
+                 skew=0, seed=None, verbose=False, handshake=0):
+        super().__init__((host, port), handler)
+        self.campus = campus
+        self.handshake = handshake
+        self.latency = latency
+        self.jitter = jitter
+        self.failure = failure
+        self.skew = skew
+        self.seed = seed
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def configure_client(self):
+        # Points the clients of this process at the server.
+        set_base_url(self.base_url)
+        bykc_encrypt.set_public_key(self.campus.public_key)
+
+    def start(self):
+        # Serves in background, e.g. for benchmarks within one process.
+        threading.Thread(target=self.campus.simulate, daemon=True).start()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.campus.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+parser = argparse.ArgumentParser(prog='python -m buaa.mock', add_help=False,
+                                 description='A local stand-in of SSO, WebVPN, BYKC and JWXT for testing and '
+                                             'benchmarking without touching the real services.')
+parser.add_argument('-h', '--help', action='help', help='To show help.')
+parser.add_argument('username', type=str, help='The account accepted by the stand-in SSO.')
+parser.add_argument('password', type=str, help='Its password.')
+parser.add_argument('--host', default=DEFAULT_HOST, type=str, help=f'The address to listen on. The default is '
+                                                                   f'{DEFAULT_HOST}.')
+parser.add_argument('--port', default=DEFAULT_PORT, type=int, help=f'The port. The default is {DEFAULT_PORT}.')
+parser.add_argument('--latency', nargs=2, default=(0, 0), type=float, metavar=('base', 'jitter'),
+                    help='Delay every response by `base` plus a random part of up to `jitter` seconds.')
+parser.add_argument('--handshake', default=0, type=float, metavar='seconds',
+                    help='Delay every new connection, as the handshakes with a remote server would.')
+parser.add_argument('--failure', default=0, type=float, metavar='rate',
+                    help='The probability of answering a request with 503.')
+parser.add_argument('--skew', default=0, type=float, metavar='seconds',
+                    help='How far the clock in the Date header is ahead of the local one.')
+parser.add_argument('--courses', default=DEFAULT_COURSES, type=int, help='The number of BYKC courses.')
+parser.add_argument('--open-in', default=60, type=float, metavar='seconds',
+                    help='When the enrollment of the upcoming BYKC courses opens.')
+parser.add_argument('--churn', default=DEFAULT_CHURN, type=float, metavar='rate',
+                    help='Seat changes per second caused by other students.')
+parser.add_argument('--seed', default=None, type=int, help='The seed of the generated data.')
+parser.add_argument('-v', '--verbose', action='store_true', help='Log every request.')
+
+
+def main():
+    args = parser.parse_args()
+    server = mock_server(campus(args.username, args.password, courses=args.courses, open_in=args.open_in,
+                                churn=args.churn, seed=args.seed),
+                         host=args.host, port=args.port, latency=args.latency[0], jitter=args.latency[1],
+                         failure=args.failure, skew=args.skew, seed=args.seed, verbose=args.verbose,
+                         handshake=args.handshake)
+    print('Point the clients at this server with:')
+    print(f'export BUAA_BASE_URL={server.base_url}')
+    print(f'export BUAA_BYKC_PUBLIC_KEY={server.campus.public_key}')
+    threading.Thread(target=server.campus.simulate, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+__all__ = [
+    'campus',
+    'mock_server',
+]
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f'{e.__class__.__qualname__}: {str(e)}')
+        sys.exit(1)
@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+
+DEFAULT_ATTEMPTS = 17  # tries per call, the first one included
+DEFAULT_BASE = 0.1  # seconds of the first backoff
+DEFAULT_CAP = 5  # upper bound of a single backoff
+DEFAULT_THRESHOLD = 8  # consecutive failures of a service that open its circuit
+DEFAULT_COOLDOWN = 30  # seconds an open circuit rejects calls
+
+
+class CircuitOpen(Exception):
+    def __init__(self, service, retry_after):
+        super().__init__(f'Service {service} is unavailable, retry after {retry_after:.0f} seconds')
+        self.service = service
+        self.retry_after = retry_after
+
+
+# Retries calls with exponential backoff and full jitter. Every endpoint has an
+# attempt budget, and a service whose endpoints keep failing has its circuit
+# opened: calls are rejected with `CircuitOpen` until the cooldown is over, and
+# then a single trial call decides whether it closes again. Endpoints are named
+# `service/name`, e.g. `bykc/querySelectableCourse`.
+class retry_policy:
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, base=DEFAULT_BASE, cap=DEFAULT_CAP, threshold=DEFAULT_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN, budgets=None, sleep=time.sleep, clock=time.monotonic):
+        self.attempts = max(attempts, 1)
+        self.base = base
+        self.cap = cap
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.budgets = dict(budgets or {})
+        self.sleep = sleep
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.opened = {}
+        self.stats = {'retry': 0, 'giveup': 0, 'reject': 0, 'open': 0}
+
+    @staticmethod
+    def service(endpoint):
+        return endpoint.split('/', 1)[0]
+
+    def budget(self, endpoint):
+        return self.budgets.get(endpoint, self.attempts)
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+    def check(self, endpoint):
+        service = self.service(endpoint)
+        with self.lock:
+            opened = self.opened.get(service, None)
+            if opened is None:
+                return
+            left = opened + self.cooldown - self.clock()
+            if left > 0:
+                self.stats['reject'] += 1
+                raise CircuitOpen(service, left)
+            # Half open: let this call through as the trial, and keep the others out
+            # until it is done.
+            self.opened[service] = self.clock()
+
+    def succeed(self, endpoint):
+        service = self.service(endpoint)
+        with self.lock:
+            self.failures[service] = 0
+            self.opened.pop(service, None)
+
+    def fail(self, endpoint):
+        # Returns whether the circuit of the service is open after the failure.
+        service = self.service(endpoint)
+        with self.lock:
+            failures = self.failures.get(service, 0) + 1
+            self.failures[service] = failures
+            if service in self.opened or failures >= self.threshold:
+                if service not in self.opened:
+                    self.stats['open'] += 1
+                self.opened[service] = self.clock()
+                return True
+            return False
+
+    def call(self, endpoint, fn, accept=None, retryable=None, recover=None):
+        # Calls `fn` until it returns a result passing `accept` (not None by
+        # default). Exceptions rejected by `retryable` are raised at once. Between
+        # tries, `recover` is called if given, e.g. to renew the session. When
+        # the budget runs out, the last exception is raised, or else the last
+        # rejected result is returned.
+        if accept is None:
+            accept = lambda res: res is not None
+        self.check(endpoint)
+        budget = self.budget(endpoint)
+        error, res = None, None
+        for attempt in range(budget):
+            try:
+                res = fn()
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                if retryable is not None and not retryable(e):
+                    # The service did answer, it only refused the request. An error
+                    # some inner call gave up on has been counted there already.
+                    if getattr(e, 'retry_endpoint', None) is None:
+                        self.succeed(endpoint)
+                    raise
+                error, res = e, None
+            else:
+                if accept(res):
+                    self.succeed(endpoint)
+                    return res
+                error = None
+            if self.fail(endpoint) or attempt == budget - 1:
+                break
+            self.stats['retry'] += 1
+            self.sleep(self.backoff(attempt))
+            if recover is not None:
+                try:
+                    recover()
+                except Exception as e:
+                    error, res = e, None
+        self.stats['giveup'] += 1
+        if error is not None:
+            error.retry_endpoint = endpoint
+            raise error
+        return res
+
+
+__all__ = [
+    'CircuitOpen',
+    'retry_policy',
+]
@@ -0,0 +1,105 @@
+import datetime
+
+DEFAULT_LEAD = 60  # seconds before a window opens to start fast polling
+DEFAULT_BURST = 30  # seconds after a window opens to keep fast polling
+DEFAULT_FAST = 0.2  # interval of fast polling
+DEFAULT_QUIET = 60  # interval while no window is about to open
+DEFAULT_WARMUP = 180  # seconds before a window opens to warm up the session
+
+
+# Decides how long to wait before the next poll from the enrollment windows of
+# the watched courses: sleep through closed windows, poll fast around openings,
+# poll at the normal interval while a window is open.
+class poll_scheduler:
+    def __init__(self, interval, lead=DEFAULT_LEAD, burst=DEFAULT_BURST, fast=DEFAULT_FAST, quiet=DEFAULT_QUIET,
+                 clock=None, warmup=DEFAULT_WARMUP):
+        self.interval = interval
+        self.lead = datetime.timedelta(seconds=lead)
+        self.burst = datetime.timedelta(seconds=burst)
+        self.fast = min(fast, interval)
+        self.quiet = max(quiet, interval)
+        self.warmup = datetime.timedelta(seconds=max(warmup, lead))
+        self.clock = clock if clock is not None else datetime.datetime.now
+        self.windows = {}
+        self.warmed = set()
+
+    def watch(self, id, start=None, end=None):
+        # A window without start is treated as open.
+        self.windows[id] = (start, end)
+
+    def update(self, courses):
+        for id, course in courses.items():
+            self.watch(id, course.select_start, course.select_end)
+
+    def forget(self, id):
+        self.windows.pop(id, None)
+
+    def retain(self, ids):
+        ids = set(ids)
+        for id in [id for id in self.windows if id not in ids]:
+            del self.windows[id]
+
+    def expire(self, now=None):
+        # Drops and returns the IDs whose window has already closed.
+        if now is None:
+            now = self.clock()
+        expired = {id for id, (_, end) in self.windows.items() if end is not None and end < now}
+        for id in expired:
+            del self.windows[id]
+        return expired
+
+    def ready(self, id, now=None):
+        # Whether an enrollment attempt for `id` can succeed soon: its window is
+        # unknown, open or about to open.
+        window = self.windows.get(id, None)
+        if window is None or window[0] is None:
+            return True
+        if now is None:
+            now = self.clock()
+        return window[0] - self.lead <= now
+
+    def warm_due(self, now=None):
+        # Whether the session should be warmed up for an opening within the
+        # warm-up lead; true only once per opening.
+        if now is None:
+            now = self.clock()
+        due = {start for start, _ in self.windows.values()
+               if start is not None and start not in self.warmed and start - self.warmup <= now <= start}
+        self.warmed |= due
+        return bool(due)
+
+    def phase(self, now=None):
+        if now is None:
+            now = self.clock()
+        if not self.windows:
+            return 'unknown'
+        phase = 'closed'
+        for start, end in self.windows.values():
+            if start is None:
+                phase = 'open'
+                continue
+            if start - self.lead <= now <= start + self.burst:
+                return 'opening'
+            if start <= now and (end is None or now <= end):
+                phase = 'open'
+        return phase
+
+    def delay(self, now=None):
+        if now is None:
+            now = self.clock()
+        self.expire(now)
+        phase = self.phase(now)
+        if phase == 'opening':
+            return self.fast
+        if phase in ('open', 'unknown'):
+            return self.interval
+        # Every window is still closed: wait quietly, but wake up in time to warm
+        # up for and to poll fast around the next opening.
+        upcoming = min(start - (self.lead if start in self.warmed else self.warmup)
+                       for start, _ in self.windows.values())
+        return max(min(self.quiet, (upcoming - now).total_seconds()), self.fast)
+
+
+__all__ = [
+    'poll_scheduler',
+]
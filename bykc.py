@@ -4,6 +4,8 @@ import argparse
 import time
 import datetime
 import json
+import queue
+import concurrent.futures
 
 TRAVEL_TIME = 60
 RETRY_LIMIT = 32
@@ -58,6 +60,29 @@ parser.add_argument('-r', '--receiver', type=str, default=None, metavar='receive
 parser.add_argument('-R', '--retry', type=int, default=RETRY_LIMIT, metavar='limit',
                     help='The retry limit. The script will automatically retry when connection is aborted unexpectedly'
                          f'. The default retry limit is {RETRY_LIMIT}.')
+parser.add_argument('--cache', nargs='?', default=..., type=str, metavar='path',
+                    help='Whether to keep the login session in an encrypted on-disk cache, so that later runs skip '
+                         'the login when the cached session is still valid. The cache is stored in '
+                         f'{buaa.cache.DEFAULT_PATH} if no path is given.')
+parser.add_argument('--plan', nargs=3, default=None, type=float, metavar=('lead', 'burst', 'interval'),
+                    help='The polling plan around the opening of an enrollment window in recurrent mode. Polling '
+                         'switches to the fast interval `lead` seconds before a watched course becomes selectable, '
+                         'and keeps it for `burst` seconds after. Before that, the script polls slowly, and courses '
+                         f'whose enrollment has ended are no longer watched. The default plan is '
+                         f'`{buaa.scheduler.DEFAULT_LEAD} {buaa.scheduler.DEFAULT_BURST} {buaa.scheduler.DEFAULT_FAST}`.')
+parser.add_argument('--warmup', default=buaa.scheduler.DEFAULT_WARMUP, type=float, metavar='seconds',
+                    help='How long before a watched course becomes selectable the login session is checked and, '
+                         'if needed, renewed in recurrent mode, so that the first attempts are not delayed by a '
+                         f'login. The default is {buaa.scheduler.DEFAULT_WARMUP} seconds.')
+parser.add_argument('--rate', nargs=2, default=None, type=float, metavar=('rate', 'burst'),
+                    help='The limit of requests sent to one server: `rate` requests per second on average, and at '
+                         'most `burst` at once. Enrolling and dropping are served before list refreshes when the limit '
+                         f'is reached. The default is `{buaa.limiter.DEFAULT_RATE} {buaa.limiter.DEFAULT_BURST}`.')
+parser.add_argument('--digest', default=None, type=float, metavar='seconds',
+                    help='Merge the mails sent within this many seconds after a first one into a single digest mail, '
+                         'e.g. when many new courses are detected at once.')
+parser.add_argument('--local', action='store_true',
+                    help='Do not use the session daemon even if one is running for the account.')
 parser.add_argument('--scan', default=None, type=int, metavar='span',
                     help=f'The span to scan forward for discovering hidden courses.')
 parser.add_argument('--default', action='store_true',
@@ -76,6 +101,7 @@ def main():
         if args.safe is None:
             setattr(args, 'safe', TRAVEL_TIME)
 
+    notifier = None
     try:
         vpn = getattr(args, 'vpn', None)
 
@@ -88,17 +114,63 @@ def main():
             sender, password = mail
             server = args.server
             receiver = args.receiver
+            # Mails are sent in background, so that no attempt waits for the SMTP server.
+            notifier = buaa.smtp.dispatcher(sender, password, server=server, digest=args.digest or 0)
 
-        b = bykc(args.username, args.password, type=vpn, retry_limit=retry_limit)
+        if args.rate is not None:
+            buaa.limiter.configure(*args.rate)
+
+        cache = None
+        if args.cache is not ...:
+            cache = buaa.session_cache(args.username, args.password, type=vpn, path=args.cache)
+
+        token = buaa.CASTGC(args.username, args.password, type=vpn, cache=cache)
+        # Both clients share the backoff budgets and circuit breakers.
+        retry = buaa.retry_policy(attempts=retry_limit + 1)
 
         safety_list = None
-        safe_span = datetime.timedelta(minutes=TRAVEL_TIME)
-        if args.safe is not NotImplemented:
-            j = buaa.jwxt(args.username, args.password, type=vpn)
+        busy = None
+        # Outcome of the check of every polled course, and the courses passing it.
+        eligible = {}
+        accepted = set()
+        # Timetables revalidated in background are applied by the polling loop,
+        # so that busy and eligible never change while it is using them.
+        timetable_updates = queue.Queue()
+
+        def update_timetable(table):
+            nonlocal safety_list, busy
+            safety_list = table
+            busy = buaa.jwxt.busy(table) if table else None
+            eligible.clear()
+            accepted.clear()
+
+        def timetable():
             year = time.localtime().tm_year
-            safety_list = j.timetable(year, buaa.jwxt.semester_infer())
-            if args.safe:
-                safe_span = datetime.timedelta(minutes=max(args.safe, 0))
+            return buaa.jwxt.cached_timetable(cache, year, buaa.jwxt.semester_infer(),
+                                              lambda: buaa.jwxt(token=token, cache=cache, retry=retry),
+                                              on_update=timetable_updates.put)
+
+        safe_span = datetime.timedelta(minutes=TRAVEL_TIME)
+        table = None
+        remote = None
+        if args.time is None and args.safe is NotImplemented and not args.local:
+            # One-shot commands are served by a running daemon, without any login.
+            from buaa import daemon
+            remote = daemon.connect(args.username, type=vpn)
+        if remote is not None:
+            b = remote.bykc()
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+                # Both clients exchange the shared CASTGC for their own service tickets,
+                # so only one full login is ever performed.
+                b = pool.submit(bykc, token=token, retry_limit=retry_limit, cache=cache, retry=retry)
+                if args.safe is not NotImplemented:
+                    table = pool.submit(timetable)
+                    if args.safe:
+                        safe_span = datetime.timedelta(minutes=max(args.safe, 0))
+                b = b.result()
+                if table is not None:
+                    update_timetable(table.result())
 
         position = args.position
         is_forecast = args.forecast
@@ -115,47 +187,68 @@ def main():
                 start_time = detail.start
                 if args.safe != NotImplemented:
                     start_time -= datetime.timedelta(minutes=args.safe)
-                if start_time > datetime.datetime.now():
+                if start_time > b.now():
                     res[e] = detail
             return res
 
         scan_cache = (None, None)
         scan_interval = datetime.timedelta(seconds=SCAN_INTERVAL)
 
+        def check(courses):
+            res = [position is None or c.position in position for c in courses]
+            if busy is not None:
+                mask = busy.available_batch((c.start, c.end - c.start, safe_span) for c in courses)
+                res = [a and b for a, b in zip(res, mask)]
+            return res
+
+        polled = None
+
         def available_list():
-            nonlocal safety_list, safe_span, position, is_forecast, scan_cache
-            sel = b.selectable
+            nonlocal safety_list, safe_span, position, is_forecast, scan_cache, polled
+            while not timetable_updates.empty():
+                update_timetable(timetable_updates.get())
+            sel, delta = b.poll()
+            deltas = [delta]
             if is_forecast:
-                sel.update(b.forecast)
-            course_list = set(sel.keys())
-            if course_list and args.scan:
-                min_id = min(course_list)
-                max_id = max(course_list) + args.scan
+                fore, delta = b.poll('queryForeCourse')
+                sel.update(fore)
+                deltas.append(delta)
+            # Only courses that appeared or changed since the last poll are checked
+            # again, so that an unchanged poll costs no walk over the list.
+            if eligible:
+                pending = set()
+                for delta in deltas:
+                    for k in delta.removed:
+                        eligible.pop(k, None)
+                        accepted.discard(k)
+                    pending.update(delta.added, delta.changed)
+                # A course may move between the selectable and the forecast list.
+                pending.update(k for delta in deltas for k in delta.removed if k in sel)
+            else:
+                pending = set(sel.keys())
+            scan_res = {}
+            if sel and args.scan:
                 now = datetime.datetime.now()
                 if scan_cache[0] is None or scan_cache[0] + scan_interval < now:
-                    scan_res = scan(min_id, max_id)
+                    scan_res = scan(min(sel.keys()), max(sel.keys()) + args.scan)
                     scan_cache = (now, scan_res)
                 else:
                     scan_res = scan_cache[1]
-                course_list.update(scan_res.keys())
                 sel.update(scan_res)
-            chosen = set(b.chosen.keys())
-            res: set = course_list.difference(chosen)
-            if position is not None:
-                _res = []
-                for c in res:
-                    if sel[c].position in position:
-                        _res.append(c)
-                res = _res
-            if safety_list:
-                _res = []
-                for c in res:
-                    d = sel[c].start
-                    dt = sel[c].end - d
-                    if buaa.jwxt._schedule_available(d, dt, safety_list, safe_span):
-                        _res.append(c)
-                res = _res
-            return list(res)
+            polled = sel
+            # Courses found by the scan only are not polled, so they are checked anew.
+            scanned = [c for c in scan_res if c not in eligible and c not in pending]
+            pending = list(pending)
+            checked = check([sel[c] for c in pending + scanned])
+            for c, ok in zip(pending, checked):
+                eligible[c] = ok
+                if ok:
+                    accepted.add(c)
+                else:
+                    accepted.discard(c)
+            found = [c for c, ok in zip(scanned, checked[len(pending):]) if ok]
+            chosen = b.chosen
+            return [c for c in accepted if c not in chosen] + [c for c in found if c not in chosen]
 
         if args.forecast:
             fore = b.forecast
@@ -194,37 +287,101 @@ def main():
 
         if args.drop:
             drop = set(args.drop).intersection(ch.keys())
-            for d in drop:
-                for _ in range(retry_limit):
-                    try:
-                        res = b.drop(d)
-                        if res:
-                            print(f'Successfully dropped {d}.')
-                            break
-                    except:
-                        pass
-                    print(f'Failed to drop {d}.' + (' Retrying.' if _ < retry_limit - 1 else ''))
+
+            def drop_attempt():
+                # Returns the courses still to be dropped; the shared policy backs off
+                # between rounds. A refusal is final and leaves the round at once.
+                try:
+                    res = b.outcomes(drop=drop)
+                except buaa.CircuitOpen:
+                    raise
+                except Exception:
+                    res = {}
+                for d in sorted(drop):
+                    status = res.get(d, buaa.bykc.FAILED)
+                    if status == buaa.bykc.DONE:
+                        print(f'Successfully dropped {d}.')
+                        drop.discard(d)
+                    elif status == buaa.bykc.REFUSED:
+                        print(f'Failed to drop {d}: refused.')
+                        drop.discard(d)
+                    else:
+                        print(f'Failed to drop {d}.')
+                return drop
+
+            if drop:
+                # Outcomes of actions are kept apart from the failures of the bykc
+                # service, so that a stubborn drop cannot open its breaker.
+                retry.call('bykc-action/drop', drop_attempt, accept=lambda rest: not rest)
 
         elist = args.enroll
         amount = 0
         max_ = float('inf') if args.number is None else args.number
 
+        scheduler = None
+        if args.time is not None:
+            scheduler = buaa.poll_scheduler(args.time, *(args.plan or ()), clock=b.now, warmup=args.warmup)
+
+        windows_at = None
+
+        def schedule(elist, sel=None):
+            nonlocal windows_at
+            if scheduler is None:
+                return elist
+            scheduler.retain(elist)
+            if sel is None:
+                # Explicit targets cost no extra request once their windows are known;
+                # unknown ones are looked up again at most every SCAN_INTERVAL.
+                now = time.monotonic()
+                stale = windows_at is None or windows_at + SCAN_INTERVAL < now
+                if any(e not in scheduler.windows for e in elist) or \
+                        stale and any(scheduler.windows[e][0] is None for e in elist):
+                    sel = b.selectable
+                    windows_at = now
+            if sel is not None:
+                for e in elist:
+                    if e in sel:
+                        scheduler.watch(e, sel[e].select_start, sel[e].select_end)
+                    elif e not in scheduler.windows or scheduler.windows[e][0] is None:
+                        # Not selectable (yet or any more): its own record tells whether
+                        # the window is still to open or has closed.
+                        try:
+                            course = b.detail(e)
+                        except buaa.CircuitOpen:
+                            raise
+                        except Exception:
+                            scheduler.watch(e)
+                        else:
+                            scheduler.watch(e, course.select_start, course.select_end)
+            expired = scheduler.expire()
+            for e in expired:
+                print(f'Enrollment of {e} has ended.')
+            return [e for e in elist if e not in expired]
+
         def enroll():
             nonlocal elist, amount
             nonlocal sender, password, receiver, server
             if args.list:
-                elist = available_list()
+                elist = schedule(available_list(), polled)
+            else:
+                elist = schedule(elist)
             newlist = []
             if not elist:
                 print('No available course.')
+            # Courses whose enrollment has not opened yet are not attempted.
+            ready = [e for e in elist if scheduler is None or scheduler.ready(e)]
+            results = b.batch(enroll=ready)
             for e in elist:
-                res = b.enroll(e)
+                if e not in ready:
+                    newlist.append(e)
+                    continue
+                res = results.get(e, False)
                 if res:
                     print(f'Successfully enrolled in {e}.')
                     if to_send:
                         try:
                             course = b.detail(e)
-                            mail_res = buaa.bykc_notice(course, sender, password, receiver, server)
+                            mail_res = buaa.bykc_notice(course, sender, password, receiver, server, dispatcher=notifier)
                             if not mail_res: print('Failed to send reminder message.')
                         except:
                             print('Failed to send reminder message.')
@@ -236,8 +393,8 @@ def main():
 
         def list_check():
             nonlocal elist, b
-            newlist = b.selectable
-            new = set(newlist.keys()).difference(elist)
+            newlist, delta = b.poll()
+            new = delta.added.difference(elist)
             if not new:
                 print('No courses detected.')
                 return
@@ -246,7 +403,8 @@ def main():
                 print(newlist[k], end='')
                 if to_send:
                     try:
-                        mail_res = buaa.bykc_notice(b.detail(k), sender, password, receiver, server)
+                        mail_res = buaa.bykc_notice(b.detail(k), sender, password, receiver, server,
+                                                    dispatcher=notifier)
                         if not mail_res: print('Failed to send notice.')
                     except:
                         print('Failed to send notice.')
@@ -258,17 +416,43 @@ def main():
             if args.continuous > 1 and args.list:
                 elist = set(b.selectable.keys())
                 while True:
-                    list_check()
+                    # Cached lists only merge the requests of one round; every round
+                    # polls afresh, however short the interval.
+                    b.invalidate()
+                    try:
+                        list_check()
+                    except buaa.CircuitOpen as e:
+                        print(e)
+                        time.sleep(e.retry_after)
+                    except Exception as e:
+                        # The retry budget ran out; the breaker keeps count across rounds.
+                        print(f'{e.__class__.__qualname__}: {str(e)}')
                     time.sleep(args.time)
+                    b.warm()
             else:
                 if args.list:
                     elist = available_list()
+                print(f'Server clock offset: {b.clock}')
                 while elist or amount >= max_ or args.continuous == 1:
-                    enroll()
-                    time.sleep(args.time)
+                    b.invalidate()
+                    try:
+                        enroll()
+                    except buaa.CircuitOpen as e:
+                        # The service is down: pause instead of polling it.
+                        print(e)
+                        time.sleep(e.retry_after)
+                    except Exception as e:
+                        print(f'{e.__class__.__qualname__}: {str(e)}')
+                    time.sleep(scheduler.delay())
+                    b.warm(force=scheduler.warm_due())
                 print('Enrolled in all targets')
     except:
         raise
+    finally:
+        if notifier is not None:
+            notifier.close()
+            if notifier.stats['failed']:
+                print(f'Failed to send {notifier.stats["failed"]} mail(s).')
 
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@ from buaa import jwxt
 import buaa
 import argparse
 import time
+import datetime
 import re
 import sys, os
 
@@ -15,8 +16,10 @@ parser.add_argument('username', type=str, help='The unified identity authenticat
 parser.add_argument('password', type=str, help='Password of the account.')
 parser.add_argument('course', nargs='?', type=str,
                     help='The ID of courses to enroll in. Required except for timetable output.')
-parser.add_argument('rank', nargs='?', type=str,
-                    help='The rank indicates the n-th of courses with the same ID.')
+parser.add_argument('rank', nargs='*', type=str,
+                    help='The rank indicates the n-th of courses with the same ID. Several ranks can be passed to '
+                         'watch a number of sections of the course at once, and the first one with free places '
+                         'will be enrolled in.')
 parser.add_argument('-y', '--year', default=None, type=int, metavar='YYYY',
                     help='The current year. The academic year will be automatically calculated according to year and '
                          'semester.')
@@ -50,18 +53,50 @@ parser.add_argument('-R', '--retry', type=int, default=RETRY_LIMIT, metavar='lim
                     help='The retry limit. The script will automatically retry when connection is aborted unexpectedly'
                          f'. The default retry limit is {RETRY_LIMIT}.')
 
+parser.add_argument('--cache', nargs='?', default=..., type=str, metavar='path',
+                    help='Whether to keep the login session in an encrypted on-disk cache, so that later runs skip '
+                         'the login when the cached session is still valid. The cache is stored in '
+                         f'{buaa.cache.DEFAULT_PATH} if no path is given.')
+parser.add_argument('--open', default=None, type=str, metavar='"YYYY-MM-DD HH:MM:SS"',
+                    help='The time when the enrollment opens. With `-t`, the script polls slowly until shortly '
+                         'before this time and then polls fast for a while after it.')
+parser.add_argument('--rate', nargs=2, default=None, type=float, metavar=('rate', 'burst'),
+                    help='The limit of requests sent to one server: `rate` requests per second on average, and at '
+                         'most `burst` at once. Enrolling and dropping are served before list refreshes when the limit '
+                         f'is reached. The default is `{buaa.limiter.DEFAULT_RATE} {buaa.limiter.DEFAULT_BURST}`.')
+parser.add_argument('--local', action='store_true',
+                    help='Do not use the session daemon even if one is running for the account.')
+parser.add_argument('--warmup', default=buaa.scheduler.DEFAULT_WARMUP, type=float, metavar='seconds',
+                    help='How long before the opening time given by `--open` the login session is checked and, if '
+                         f'needed, renewed. The default is {buaa.scheduler.DEFAULT_WARMUP} seconds.')
 
 def main():
     args = parser.parse_args()
 
+    notifier = None
     try:
         vpn = getattr(args, 'vpn', None)
 
-        j = jwxt(args.username, args.password, type=vpn)
-        t = time.localtime()
+        if args.rate is not None:
+            buaa.limiter.configure(*args.rate)
+
+        cache = None
+        if args.cache is not ...:
+            cache = buaa.session_cache(args.username, args.password, type=vpn, path=args.cache)
 
-        retry_count = 0
         retry_limit = max(args.retry, 0)
+        retry = buaa.retry_policy(attempts=retry_limit + 1)
+
+        remote = None
+        if args.time is None and args.export is ... and not args.local:
+            # One-shot commands are served by a running daemon, without any login.
+            from buaa import daemon
+            remote = daemon.connect(args.username, type=vpn)
+        if remote is not None:
+            j = remote.jwxt()
+        else:
+            j = jwxt(args.username, args.password, type=vpn, cache=cache, retry=retry)
+        t = time.localtime()
 
         semester = args.semester
         if semester is not None:
@@ -91,15 +126,15 @@ def main():
         if typ not in ('JC', 'TS', 'ZY'):
             typ = jwxt.course_type(course[2] if len(course) >= 3 else 'I')
 
-        rank = args.rank
-        if rank is None:
-            rank = '001'
-        else:
+        ranks = []
+        for rank in args.rank or ['001']:
             rank_int = re.search(number_re, rank)
             if rank_int is None:
                 rank = '001-' + rank
             else:
                 rank = ('0' * max(0, 3 - len(rank_int.group(1)))) + rank
+            ranks.append(rank)
+        rank = ranks[0]
 
         wish = max(1, args.wish)
         weight = max(min(args.weight, 100), 1)
@@ -111,26 +146,35 @@ def main():
             sender, password = mail
             server = args.server
             receiver = args.receiver
+            # Mails are sent in background, so that no attempt waits for the SMTP server.
+            notifier = buaa.smtp.dispatcher(sender, password, server=server)
 
         def enroll():
             nonlocal year, semester, course, typ, rank, wish, weight
             nonlocal sender, password, receiver, server
-            res = False
-            while retry_count <= retry_limit:
-                try:
-                    res = j.choose(year, semester, course, typ, rank, wish=wish, weight=weight, verbose=True)
-                except Exception as e:
-                    if isinstance(e, buaa.BUAAException):
-                        raise
-                    if retry_count < retry_limit:
-                        print(f'{e.__class__.__qualname__}: {str(e)}')
-                    else:
-                        raise
-                else:
-                    break
+
+            def attempt():
+                target = rank
+                if len(ranks) > 1:
+                    # One page fetch tells the places of every watched section.
+                    places = j.watch(year, semester, [(course, r) for r in ranks], typ)
+                    available = [r for r in ranks if (places.get((course, r), None) or 0) > 0]
+                    if not available:
+                        return False
+                    target = available[0]
+                return j.choose(year, semester, course, typ, target, wish=wish, weight=weight, verbose=True)
+
+            def retryable(e):
+                if isinstance(e, buaa.BUAAException):
+                    return False
+                print(f'{e.__class__.__qualname__}: {str(e)}')
+                return True
+
+            res = retry.call('jwxt/enroll', attempt, accept=lambda res: True, retryable=retryable)
             if res and to_send:
                 try:
-                    mail_res = buaa.remind(course, sender, password, receiver, server, title=f'Reminder: {course}')
+                    mail_res = buaa.remind(course, sender, password, receiver, server, title=f'Reminder: {course}',
+                                           dispatcher=notifier)
                     if not mail_res: print('Failed to send reminder message.')
                 except:
                     print('Failed to send reminder message.')
@@ -152,14 +196,29 @@ def main():
                 else:
                     print(f'Enrolling in {course} failed')
             else:
+                scheduler = buaa.poll_scheduler(args.time, clock=j.now, warmup=args.warmup)
+                if args.open is not None:
+                    scheduler.watch(course, datetime.datetime.fromisoformat(args.open))
                 count = 0
-                while not enroll():
+                while True:
+                    try:
+                        if enroll():
+                            break
+                    except buaa.CircuitOpen as e:
+                        print(e)
+                        time.sleep(e.retry_after)
                     count += 1
                     print(f'{count}: Enrolling in {course} failed')
-                    time.sleep(args.time)
+                    time.sleep(scheduler.delay())
+                    j.warm(force=scheduler.warm_due())
                 print(f'Successfully enrolled in {course}')
     except:
         raise
+    finally:
+        if notifier is not None:
+            notifier.close()
+            if notifier.stats['failed']:
+                print(f'Failed to send {notifier.stats["failed"]} mail(s).')
 
 
 if __name__ == '__main__':
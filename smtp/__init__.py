@@ -3,6 +3,10 @@ from email.mime.multipart import MIMEBase as _mimebase, MIMEMultipart as _mimemu
 from email.mime.text import MIMEText as _mimetext
 from email.header import Header as _header
 import re as _re
+import os as _os
+import queue as _queue
+import threading as _threading
+import time as _time
 
 _smtp_lut = {
 	'263.net.cn': '263.net.cn',
@@ -87,6 +91,114 @@ def mail(smtp: login, mime: _mimebase, sender=None, receiver=None):
     except _smtplib.SMTPException:
         return False
 
+class dispatcher:
+    # Sends mails from a background thread over one authenticated connection,
+    # which is opened on the first mail and reopened when the server drops it.
+    # With `digest` seconds, mails queued within that time after the first one
+    # are merged into a single digest mail per receiver.
+    def __init__(self, username, password, sender=None, server=None, digest=0, subject='Digest of %d notices'):
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.server = server
+        self.digest = digest
+        self.subject = subject
+        self.queue = _queue.Queue()
+        self.connection = None
+        self.stats = {'sent': 0, 'failed': 0, 'connect': 0}
+        self.thread = _threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def send(self, mime: _mimebase, receiver=None):
+        # Returns at once; the outcome is only counted in `stats`.
+        self.queue.put((mime, receiver))
+        return True
+
+    def close(self, wait=True):
+        # Flushes the queue and closes the connection.
+        self.queue.put(None)
+        if wait:
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __connect(self):
+        self.__disconnect()
+        self.stats['connect'] += 1
+        connection = login_mail(self.username, self.password, sender=self.sender, server=self.server)
+        if connection is None:
+            return None
+        try:
+            connection.smtp.login(connection.username, connection.password)
+        except _smtplib.SMTPException:
+            connection.smtp.close()
+            return None
+        self.connection = connection
+        return connection
+
+    def __disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.smtp.quit()
+            except (_smtplib.SMTPException, OSError):
+                pass
+            finally:
+                # quit() leaves the socket open when the server does not answer.
+                self.connection.smtp.close()
+            self.connection = None
+
+    def __deliver(self, mime, receiver):
+        # A dropped connection is reopened once before the mail is given up.
+        for _ in range(2):
+            try:
+                connection = self.connection or self.__connect()
+                if connection is not None and mail(connection, mime, receiver=receiver):
+                    self.stats['sent'] += 1
+                    return True
+            except OSError:
+                pass
+            self.__disconnect()
+        self.stats['failed'] += 1
+        return False
+
+    def __merge(self, mimes):
+        if len(mimes) == 1:
+            return mimes[0]
+        merged = _mimemulti('mixed')
+        for mime in mimes:
+            merged.attach(mime)
+        merged['Subject'] = _header(self.subject % len(mimes), 'utf-8')
+        return merged
+
+    def __run(self):
+        closed = False
+        while not closed:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            if self.digest:
+                deadline = _time.monotonic() + self.digest
+                while True:
+                    try:
+                        item = self.queue.get(timeout=max(deadline - _time.monotonic(), 0))
+                    except _queue.Empty:
+                        break
+                    if item is None:
+                        closed = True
+                        break
+                    batch.append(item)
+            receivers = {}
+            for mime, receiver in batch:
+                receivers.setdefault(receiver, []).append(mime)
+            for receiver, mimes in receivers.items():
+                self.__deliver(self.__merge(mimes), receiver)
+        self.__disconnect()
+
 def mime_text(subject, text, from_=None, to=None):
     mime = _mimetext(text, 'plain', 'utf-8')
     mime['Subject'] = _header(subject, 'utf-8')
@@ -94,12 +206,40 @@ def mime_text(subject, text, from_=None, to=None):
     mime['To'] = to
     return mime
 
-def mime_from_file(subject, filename, from_=None, to=None, replace={}):
+_template_re = _re.compile(r'\{\{ *([^{}]*?) *\}\}')
+_templates = {}
+
+def template(filename):
+    # Returns the encoding and the segments of a template file: literal text at
+    # even indices, (variable, placeholder) pairs at odd ones. Parsed templates
+    # are kept until the file is modified.
+    mtime = _os.stat(filename).st_mtime_ns
+    cached = _templates.get(filename, None)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
     with open(filename, 'r') as file:
         html = file.read()
-    for pattern, dest in re_replacer(replace).items():
-        html = _re.sub(pattern, dest, html)
-    mime = _mimetext(html, 'html', file.encoding)
+    segments = []
+    last = 0
+    for m in _template_re.finditer(html):
+        segments.append(html[last:m.start()])
+        segments.append((m.group(1), m.group(0)))
+        last = m.end()
+    segments.append(html[last:])
+    _templates[filename] = (mtime, file.encoding, segments)
+    return file.encoding, segments
+
+def render(segments, variables):
+    # Unknown variables keep their placeholder.
+    return ''.join(
+        segment if i % 2 == 0 else (str(variables[segment[0]]) if segment[0] in variables else segment[1])
+        for i, segment in enumerate(segments)
+    )
+
+def mime_from_file(subject, filename, from_=None, to=None, replace={}):
+    encoding, segments = template(filename)
+    html = render(segments, replace)
+    mime = _mimetext(html, 'html', encoding)
     mime['Subject'] = _header(subject, 'utf-8')
     mime['From'] = from_
     mime['To'] = to
@@ -0,0 +1,38 @@
+# Timing of the timetable check of BYKC candidates: busy_index.available_batch
+# over all candidates at once, against jwxt._schedule_available per course on
+# the sorted list of course_time used before. Timetables are built from the
+# saved pages. Run with `python tests/bench_busy.py`.
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import buaa
+from test_busy import candidates, table
+from test_timetable import pages
+
+REPEAT = 5
+
+
+def main():
+    items = list(candidates())
+    for name, page, _ in pages():
+        courses = table(page)
+        old = list(courses)
+        for count in (100, 1000, 10000):
+            batch = items[:count]
+            per_course = min(timeit.repeat(
+                lambda: [buaa.jwxt._schedule_available(t, tspan, old, span) for t, tspan, span in batch],
+                number=1, repeat=REPEAT))
+            # The index is built once per timetable and kept by the table.
+            batched = min(timeit.repeat(lambda: buaa.jwxt.busy(courses).available_batch(batch),
+                                        number=1, repeat=REPEAT))
+            build = min(timeit.repeat(lambda: buaa.busy_index(courses.starts), number=1, repeat=REPEAT))
+            print(f'{name:20} {len(courses):4} items {count:6} courses  per course {per_course * 1e3:8.2f} ms  '
+                  f'batch {batched * 1e3:7.2f} ms  index {build * 1e3:5.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Memory and parse time of a timetable as the columnar jwxt.course_table,
+# against the sorted list of jwxt.course_time objects used before, on the saved
+# pages and on pages with many times the rows.
+# Run with `python tests/bench_course_table.py`.
+import datetime
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import buaa
+from bench_timetable import scaled
+from test_busy import FIRST_DAY, table
+from test_timetable import pages, parse
+
+REPEAT = 5
+
+
+def course_times(page, first_day=FIRST_DAY):
+    # The timetable as jwxt.timetable built it before the columnar table.
+    res = []
+    for day, name, items in parse(page):
+        for teacher_weeks, periods in items:
+            starts = list(map(buaa.time_lut, buaa.timespan(periods)))
+            for teacher, weeks in teacher_weeks:
+                for w in buaa.timespan(weeks):
+                    for t in starts:
+                        res.append(buaa.jwxt.course_time(name, teacher,
+                                                         first_day + datetime.timedelta(days=(w - 1) * 7 + day) + t))
+    return sorted(res)
+
+
+def measure(build, page):
+    # Seconds to parse the page and bytes held by the result.
+    seconds = min(timeit.repeat(lambda: build(page), number=1, repeat=REPEAT))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    res = build(page)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return len(res), seconds, size
+
+
+def main():
+    for name, page, _ in pages():
+        for factor in (1, 10):
+            text = scaled(page, factor)
+            for label, build in (('course_time list', course_times), ('course_table', table)):
+                count, seconds, size = measure(build, text)
+                print(f'{name:20} x{factor:<3} {label:17} {count:6} items {seconds * 1e3:8.2f} ms '
+                      f'{size / 1024:9.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
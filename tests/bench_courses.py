@@ -0,0 +1,61 @@
+# CPU time and memory of one BYKC poll over a few thousand courses: every
+# course built at once as before, against the lazy bykc.course_map, which
+# builds only the courses read and reuses them while the payload is unchanged.
+# Run with `python tests/bench_courses.py`.
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import buaa
+from buaa.mock import campus
+
+NUMBER = 20
+READ = 10  # courses looked at per poll, e.g. the targets
+
+
+def eager(data):
+    return {c['id']: buaa.bykc.course(c) for c in data}
+
+
+def lazy(data, built=None):
+    res = buaa.bykc.course_map(data, buaa.bykc.course, built)
+    for id in list(res)[:READ]:
+        res[id]
+    return res
+
+
+def measure(poll):
+    # Seconds and peak bytes per poll.
+    poll()
+    seconds = min(timeit.repeat(poll, number=NUMBER, repeat=5)) / NUMBER
+    tracemalloc.start()
+    poll()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    for count in (1000, 3000, 6000):
+        data = list(campus('user', 'password', courses=count, seed=0).bykc_courses.values())
+        raw = json.dumps(data)
+        built = {}
+        cases = (
+            # A changed payload is decoded anew into fresh entries.
+            ('eager, new payload', lambda: eager(json.loads(raw))),
+            ('lazy, new payload', lambda: lazy(json.loads(raw))),
+            # An unchanged payload hands out the very same entries again.
+            ('eager, same payload', lambda: eager(data)),
+            ('lazy, same payload', lambda: lazy(data, built)),
+        )
+        for name, poll in cases:
+            seconds, peak = measure(poll)
+            print(f'{count:5} courses  {name:20} {seconds * 1e3:8.2f} ms {peak / 1024:10.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
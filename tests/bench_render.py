@@ -0,0 +1,31 @@
+# Time per rendered mail template: the cached segments of smtp.template filled
+# in by smtp.render, against reading the file and running one regex
+# substitution per variable as mime_from_file did before.
+# Run with `python tests/bench_render.py`.
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import smtp
+from test_render import TEMPLATES, VARIABLES, substituted
+
+NUMBER = 2000
+
+
+def rendered(filename, variables):
+    return smtp.render(smtp.template(filename)[1], variables)
+
+
+def main():
+    for name, variables in VARIABLES.items():
+        filename = os.path.join(TEMPLATES, name)
+        for label, fn in (('re_replacer', substituted), ('template', rendered)):
+            seconds = min(timeit.repeat(lambda: fn(filename, variables), number=NUMBER, repeat=5)) / NUMBER
+            print(f'{name:18} {len(variables):3} variables  {label:12} {seconds * 1e6:8.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Request latency against buaa.mock with pooled keep-alive sessions, against
+# a new connection per request as with the module-level requests.post/get used
+# before. The stand-in delays every new connection by a handshake time and
+# every response by a round trip. Run with `python tests/bench_sessions.py`.
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import buaa
+from buaa.mock import campus, mock_server
+
+POLLS = 30
+# Seconds of handshake and round trip: on campus, and through WebVPN from off
+# campus.
+SETTINGS = ((0.03, 0.015), (0.12, 0.06))
+
+
+def poll_bykc(b):
+    b.invalidate()
+    return b.selectable
+
+
+def poll_jwxt(j):
+    return j.watch(2026, 2, [('B3I062410', '001')])
+
+
+def measure(client, poll, fresh):
+    # Median seconds per poll; `fresh` makes the server close every connection.
+    if fresh:
+        client.http.headers['Connection'] = 'close'
+    else:
+        client.http.headers['Connection'] = 'keep-alive'
+        poll(client)
+    timings = []
+    for _ in range(POLLS):
+        start = time.perf_counter()
+        poll(client)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    buaa.limiter.configure(rate=0)
+    for handshake, latency in SETTINGS:
+        server = mock_server(campus('user', 'password', seed=0, churn=0), port=0, handshake=handshake,
+                             latency=latency).start()
+        server.configure_client()
+        try:
+            token = buaa.CASTGC('user', 'password')
+            clients = (('bykc list', buaa.bykc(token=token), poll_bykc),
+                       ('jwxt watch', buaa.jwxt(token=token), poll_jwxt))
+            for name, client, poll in clients:
+                before = measure(client, poll, fresh=True)
+                after = measure(client, poll, fresh=False)
+                print(f'handshake {handshake * 1e3:4.0f} ms, rtt {latency * 1e3:4.0f} ms  {name:10} '
+                      f'new connection {before * 1e3:7.2f} ms  pooled {after * 1e3:7.2f} ms  '
+                      f'({before / after:.1f}x)')
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
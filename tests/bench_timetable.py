@@ -0,0 +1,40 @@
+# Timing of the JWXT timetable parser on the saved pages, on pages with many
+# times the rows and on a malformed row, to show that the cost grows linearly
+# with the page.
+# Run with `python tests/bench_timetable.py`.
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_timetable import pages, parse
+
+NUMBER = 200
+
+
+def scaled(page, factor):
+    # The page with its table body repeated `factor` times.
+    start = page.find('<tr class=')
+    end = page.rfind('</tr>') + len('</tr>')
+    return page[:start] + page[start:end] * factor + page[end:]
+
+
+def main():
+    for name, page, _ in pages():
+        for factor in (1, 10, 100):
+            text = scaled(page, factor)
+            number = max(NUMBER // factor, 1)
+            seconds = min(timeit.repeat(lambda: parse(text), number=number, repeat=5)) / number
+            print(f'{name:20} x{factor:<4} {len(text) / 1024:8.1f} KiB {seconds * 1e6:10.1f} us '
+                  f'{seconds * 1e6 / (len(text) / 1024):8.2f} us/KiB')
+    # A row without </tr>, which the old pattern needed seconds for.
+    for count in (24, 240, 2400):
+        text = '<tr class="x">' + '<td>a</td>' * count + '<tr class="y">'
+        seconds = min(timeit.repeat(lambda: parse(text), number=NUMBER, repeat=5)) / NUMBER
+        print(f'{"unclosed row":20} {count:<5} {len(text) / 1024:8.1f} KiB {seconds * 1e6:10.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import datetime
+
+import buaa
+
+from test_timetable import pages, parse
+
+FIRST_DAY = datetime.datetime(2026, 2, 23)
+
+
+def table(page, first_day=FIRST_DAY):
+    # The course table of a saved page, built the way jwxt.timetable builds it.
+    res = buaa.jwxt.course_table(first_day)
+    first = buaa._seconds(first_day)
+    for day, name, items in parse(page):
+        for teacher_weeks, periods in items:
+            starts = [buaa.PERIOD_SECONDS[min(max(t, 1), 14) - 1] for t in buaa.timespan(periods)]
+            for teacher, weeks in teacher_weeks:
+                for w in buaa.timespan(weeks):
+                    for t in starts:
+                        res.append(name, teacher, first + ((w - 1) * 7 + day) * 86400 + t)
+    res.sort()
+    return res
+
+
+def candidates(first_day=FIRST_DAY, weeks=18):
+    # Every quarter hour of the term from 7:00 to 23:00, with lengths and safe
+    # spans that reach over neighbouring periods.
+    for day in range(weeks * 7):
+        for minute in range(7 * 60, 23 * 60, 15):
+            t = first_day + datetime.timedelta(days=day, minutes=minute)
+            for tspan in (datetime.timedelta(minutes=45), datetime.timedelta(hours=2)):
+                for span in (datetime.timedelta(), datetime.timedelta(minutes=30)):
+                    yield t, tspan, span
+
+
+def check():
+    for name, page, _ in pages():
+        courses = table(page)
+        old = list(courses)
+        items = list(candidates())
+        expected = [buaa.jwxt._schedule_available(t, tspan, old, span) for t, tspan, span in items]
+        assert buaa.jwxt.busy(courses).available_batch(items) == expected, name
+        assert buaa.busy_index.from_schedule(old).available_batch(items) == expected, name
+
+
+def test_batch_matches_schedule_available():
+    check()
+
+
+def test_batch_matches_schedule_available_without_numpy(monkeypatch):
+    monkeypatch.setattr(buaa, '_load_numpy', lambda: None)
+    check()
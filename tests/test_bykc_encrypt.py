@@ -0,0 +1,42 @@
+import base64
+
+import pytest
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, padding as asymmetric_padding
+
+from buaa import bykc_encrypt
+
+
+@pytest.fixture
+def private_key():
+    # The envelope is checked against a key pair of our own.
+    key = rsa.generate_private_key(public_exponent=65537, key_size=1024, backend=default_backend())
+    der = key.public_key().public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    original = bykc_encrypt.RSA_PUBLIC_KEY
+    bykc_encrypt.set_public_key(base64.b64encode(der))
+    yield key
+    bykc_encrypt.set_public_key(original)
+
+
+def decrypt(key, message):
+    return key.decrypt(base64.b64decode(message), asymmetric_padding.PKCS1v15())
+
+
+def test_envelope_headers(private_key):
+    envelope = bykc_encrypt.envelope()
+    assert len(envelope.key) == 16
+    assert decrypt(private_key, envelope.ak) == envelope.key
+    for payload in (b'{}', b'{"courseId": 1}'):
+        assert decrypt(private_key, envelope.signature(payload)) == bykc_encrypt.sign(payload)
+    # The memoized header of a repeated payload is reused.
+    assert envelope.signature(b'{}') == envelope.signature(b'{}')
+
+
+def test_envelope_round_trip(private_key):
+    envelope = bykc_encrypt.envelope()
+    message = '{"status": "0", "data": "博雅"}'.encode('utf8')
+    encrypted = envelope.encrypt(message)
+    assert len(encrypted) % 16 == 0
+    assert bykc_encrypt.aes_decrypt(encrypted, envelope.key) == message
+    assert envelope.decrypt(encrypted) == message
@@ -0,0 +1,34 @@
+import smtplib
+
+import smtp
+
+
+class dropping_smtp:
+    # A connection the server drops as soon as a mail is sent.
+    opened = []
+
+    def __init__(self, host, port):
+        self.closed = False
+        self.opened.append(self)
+
+    def login(self, username, password):
+        pass
+
+    def sendmail(self, sender, receiver, message):
+        raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+    def quit(self):
+        raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+    def close(self):
+        self.closed = True
+
+
+def test_dropped_connections_are_closed(monkeypatch):
+    monkeypatch.setattr(smtplib, 'SMTP', dropping_smtp)
+    dropping_smtp.opened = []
+    with smtp.dispatcher('user@example.com', 'password') as d:
+        d.send(smtp.mime_text('Subject', 'Text'))
+        d.send(smtp.mime_text('Subject', 'Text'))
+    assert d.stats['failed'] == 2
+    assert dropping_smtp.opened and all(c.closed for c in dropping_smtp.opened)
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only some commands need: captcha display, mail and the BYKC cipher.
+HEAVY = ('cv2', 'numpy', 'PIL', 'cryptography', 'smtp')
+# Microseconds `import buaa` may spend on top of importing requests.
+BUDGET = 50000
+RUNS = 3
+
+
+def import_times():
+    # Cumulative import time in microseconds of every top-level import of
+    # `import buaa`, as reported by `python -X importtime`.
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import buaa'], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_heavy_modules_not_imported():
+    times = import_times()
+    loaded = [name for name in times if name.split('.')[0] in HEAVY]
+    assert not loaded, f'import buaa loads {", ".join(loaded)}'
+
+
+def test_import_time_budget():
+    # The best of a few runs, so that a busy machine does not fail the test.
+    best = min(times['buaa'] - times.get('requests', 0) for times in (import_times() for _ in range(RUNS)))
+    assert best <= BUDGET, f'import buaa takes {best} us on top of requests, the budget is {BUDGET} us'
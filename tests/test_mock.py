@@ -0,0 +1,87 @@
+import pytest
+
+import buaa
+from buaa import bykc_encrypt
+from buaa.mock import campus, mock_server
+
+YEAR, SEASON = 2026, 2
+
+
+@pytest.fixture(scope='module')
+def server():
+    # One stand-in server for the module, without rate limits or course churn.
+    original = (bykc_encrypt.RSA_PUBLIC_KEY, buaa.limiter.default.rate)
+    server = mock_server(campus('user', 'password', seed=0, churn=0), port=0).start()
+    server.configure_client()
+    buaa.limiter.configure(rate=0)
+    yield server
+    server.stop()
+    buaa.set_base_url(None)
+    bykc_encrypt.set_public_key(original[0])
+    buaa.limiter.configure(rate=original[1])
+
+
+@pytest.fixture
+def retry():
+    return buaa.retry_policy(attempts=3, sleep=lambda seconds: None)
+
+
+@pytest.fixture
+def token(server):
+    return buaa.CASTGC('user', 'password')
+
+
+def test_login(server, token, retry):
+    b = buaa.bykc(token=token, retry=retry)
+    assert set(b.selectable) == {id for id in server.campus.bykc_courses if (id - 1000) % 3 != 2}
+    j = buaa.jwxt(token=token, retry=retry)
+    assert j.watch(YEAR, SEASON, [('B3I062410', '001')])[('B3I062410', '001')] is not None
+    # Both services were entered with the one CAS login.
+    assert b.recovery_stats['login'] + j.recovery_stats['login'] == 1
+
+
+def test_refresh_exchanges_ticket(server, token, retry):
+    b = buaa.bykc(token=token, retry=retry)
+    logins = b.recovery_stats['login']
+    b.refresh()
+    assert b.recovery_stats['ticket'] >= 1
+    assert b.recovery_stats['login'] == logins
+
+
+def test_expired_session_recovers(server, token, retry):
+    b = buaa.bykc(token=token, retry=retry)
+    b.selectable
+    server.campus.bykc_tokens.discard(b.bykc_token)
+    b.invalidate()
+    assert b.selectable
+    assert b.bykc_token in server.campus.bykc_tokens
+
+
+def test_batch(server, token, retry):
+    b = buaa.bykc(token=token, retry=retry)
+    open_, closed = 1003, 1005
+    assert b.outcomes(enroll=[open_, closed]) == {open_: b.DONE, closed: b.REFUSED}
+    assert open_ in b.chosen
+    assert b.batch(drop=[open_]) == {open_: True}
+    assert open_ not in server.campus.bykc_chosen
+    assert b.outcomes(drop=[open_]) == {open_: b.REFUSED}
+    assert retry.failures.get('bykc', 0) == 0
+
+
+def test_poll_delta(server, token, retry):
+    b = buaa.bykc(token=token, retry=retry)
+    courses, delta = b.poll()
+    assert delta.added == set(courses)
+    b.invalidate()
+    courses, delta = b.poll()
+    assert not delta
+
+
+def test_watch(server, token, retry):
+    j = buaa.jwxt(token=token, retry=retry)
+    sections = server.campus.jwxt_sections
+    res = j.watch(YEAR, SEASON, [('B3I062410', '001'), ('B3I062410', '002'), ('B3I062410', '099')])
+    for tail in ('001', '002'):
+        current, maximum = sections[('B3I062410', tail)][:2]
+        assert res[('B3I062410', tail)] == maximum - current
+    assert res[('B3I062410', '099')] is None
@@ -0,0 +1,59 @@
+import glob
+import json
+import os
+import time
+
+import buaa
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'timetable')
+
+
+def pages():
+    # Saved queryGrkb pages, each with the schedule items expected from it.
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '*.html'))):
+        with open(path, encoding='utf8') as f:
+            page = f.read()
+        with open(path[:-len('.html')] + '.json', encoding='utf8') as f:
+            expected = json.load(f)
+        yield os.path.basename(path), page, expected
+
+
+def parse(page):
+    # Every non-empty cell as `[day, name, [[[[teacher, weeks], ...], periods], ...]]`,
+    # the way jwxt.timetable reads the page.
+    res = []
+    days = list(zip(*(row[2:] for row in buaa._timetable_rows(page))))
+    for day, cells in enumerate(days):
+        for cell in cells:
+            if cell == '&nbsp':
+                continue
+            item = buaa._timetable_cell(cell)
+            if item is None:
+                continue
+            name, items = item
+            res.append([day, name, [[[list(tw) for tw in teacher_weeks], periods] for teacher_weeks, periods in items]])
+    return res
+
+
+def test_saved_pages():
+    for name, page, expected in pages():
+        assert parse(page) == expected, name
+
+
+def test_week_grid():
+    for name, page, _ in pages():
+        rows = list(buaa._timetable_rows(page))
+        assert len(rows) == 6 and all(len(row) == 9 for row in rows), name
+
+
+def test_unclosed_row_scales_linearly():
+    # A row whose </tr> is missing made the old nine-group pattern try every
+    # split of the following cells, e.g. over a second for 24 cells; the
+    # tokenizer reads each tag once.
+    timings = []
+    for count in (200, 3200):
+        page = '<tr class="x">' + '<td>a</td>' * count + '<tr class="y">'
+        start = time.perf_counter()
+        list(buaa._timetable_rows(page))
+        timings.append(time.perf_counter() - start)
+    assert timings[1] < timings[0] * 16 * 4 + 0.01